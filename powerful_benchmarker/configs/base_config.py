@@ -6,11 +6,11 @@ from pytorch_adapt.frameworks.ignite import (
 )
 from pytorch_adapt.layers import DoNothingOptimizer
 from pytorch_adapt.models import Discriminator
-from pytorch_adapt.models import pretrained as pretrained_module
 from pytorch_adapt.models.pretrained_scores import domain_len_assertion
 from pytorch_adapt.utils.common_functions import get_lr
 
 from ..utils import main_utils
+from ..utils.process_cache import get_pretrained_model
 
 
 class BaseConfig:
@@ -93,8 +93,8 @@ class BaseConfig:
         Gkwargs, Ckwargs = self.get_model_kwargs(dataset, pretrain_on_src, src_domains)
         print("G kwargs", Gkwargs)
         print("C kwargs", Ckwargs)
-        G = getattr(pretrained_module, f"{dataset}G")(**Gkwargs)
-        C = getattr(pretrained_module, f"{dataset}C")(**Ckwargs)
+        G = get_pretrained_model(f"{dataset}G", **Gkwargs)
+        C = get_pretrained_model(f"{dataset}C", **Ckwargs)
 
         models = {"G": G, "C": C}
         models, self.feature_size, framework = self.set_feature_layer(
@@ -3,16 +3,21 @@ import os
 import subprocess
 import sys
 
-import submitit
 import torch
 import yaml
 
 sys.path.insert(0, ".")
 from powerful_benchmarker.utils.constants import (
     BEST_TRIAL_FILENAME,
+    HEARTBEAT_FILENAME,
     JOBIDS_FILENAME,
     add_default_args,
 )
+from powerful_benchmarker.utils.local_executor import (
+    add_executor_args,
+    get_executor,
+    get_local_rank,
+)
 from powerful_benchmarker.utils.utils import (
     append_jobid_to_file,
     create_exp_group_name,
@@ -70,13 +75,12 @@ def exp_launcher(cfg, exp_folder, exp_names, gcfg):
     num_gpus = torch.cuda.device_count()
     print("num gpus available in exp_launcher =", num_gpus)
 
-    job_env = submitit.JobEnvironment()
-    local_rank = job_env.local_rank
+    local_rank = get_local_rank()
     exp_name, config_name = exp_names[local_rank]
     gpu_list = list(range(num_gpus))
     use_devices = ",".join(str(x) for x in rotate(gpu_list, local_rank))
     command = base_command(cfg.dataset_folder, exp_folder, exp_name, config_name, gcfg)
-    args = f"{exp_name} {str(cfg.script_wrapper_timeout)} {exp_folder} {cfg.conda_env} {use_devices} {BEST_TRIAL_FILENAME}"
+    args = f"{exp_name} {str(cfg.script_wrapper_timeout)} {exp_folder} {cfg.conda_env} {use_devices} {BEST_TRIAL_FILENAME} {HEARTBEAT_FILENAME}"
     full_command = (
         f"bash -i ./powerful_benchmarker/scripts/script_wrapper.sh {args}".split(" ")
     )
@@ -129,7 +133,7 @@ def main(cfg, slurm_args):
         return
 
     num_tasks = len(exp_names)
-    executor = submitit.AutoExecutor(folder=os.path.join(exp_folder, cfg.slurm_folder))
+    executor = get_executor(cfg, os.path.join(exp_folder, cfg.slurm_folder))
     if cfg.is_stress_test:
         job_name = exp_group_name
     else:
@@ -155,6 +159,7 @@ if __name__ == "__main__":
     parser.add_argument("--config_names", nargs="+", type=str, required=True)
     parser.add_argument("--slurm_config", type=str, required=True)
     parser.add_argument("--group_configs", nargs="+", type=str, required=True)
+    add_executor_args(parser)
 
     # can be specified in group config or here
     parser.add_argument("--src_domains", nargs="+", type=str)
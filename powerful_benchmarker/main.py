@@ -1,7 +1,9 @@
+import gc
 import json
 import os
 import shutil
 import sys
+import threading
 from functools import partialmethod
 
 from tqdm import tqdm
@@ -34,14 +36,41 @@ from pytorch_adapt.utils import common_functions as c_f
 
 sys.path.insert(0, ".")
 from powerful_benchmarker import configs
-from powerful_benchmarker.utils import ignite_save_features, main_utils
+from powerful_benchmarker.utils import (
+    ignite_resume,
+    ignite_save_features,
+    main_utils,
+    process_cache,
+)
 from powerful_benchmarker.utils.constants import (
     BEST_TRIAL_FILENAME,
     TRIALS_FILENAME,
     add_default_args,
 )
+from powerful_benchmarker.utils.checkpoint_saver import get_min_score
+from powerful_benchmarker.utils.dedup_inference import with_dedup_inference
 from powerful_benchmarker.utils.get_validator import get_validator
+from powerful_benchmarker.utils.heartbeat import (
+    Heartbeat,
+    heartbeat_callback,
+    write_heartbeat,
+)
 from powerful_benchmarker.utils.logger import Logger
+from powerful_benchmarker.utils.perf_telemetry import PerfTelemetry
+from powerful_benchmarker.utils.pruning import PRUNERS, EpochPruner, get_pruner
+from powerful_benchmarker.utils.shared_batches import SharedBatches
+from powerful_benchmarker.utils.successive_halving import (
+    StopAtEpoch,
+    get_promoted,
+    get_rung_epochs,
+)
+from powerful_benchmarker.utils.val_schedule import (
+    VAL_SCHEDULES,
+    get_val_schedule,
+    with_val_schedule,
+)
+from powerful_benchmarker.utils.warm_start import get_warm_start_sampler
+from powerful_benchmarker.utils.watchdog import LossWatchdog
 
 print("pytorch_adapt.__version__", pytorch_adapt.__version__)
 
@@ -70,30 +99,51 @@ def evaluate_best_model(cfg, exp_path):
         setattr(cfg, k, original_cfg[k])
     trial = optuna.trial.FixedTrial(original_cfg["trial_params"])
 
-    scores = {}
-    for d in cfg.target_domains:
-        (
-            framework,
-            adapter,
-            datasets,
-            dataloader_creator,
-            validator,
-            checkpoint_fn,
-            _,
-            _,
-            _,
-        ) = get_adapter_datasets_etc(cfg, exp_path, [d], trial)
-        adapter = framework(adapter, checkpoint_fn=checkpoint_fn)
-        validator = validator.validator  # don't need ScoreHistory
-        scores[d] = main_utils.evaluate(
-            adapter, datasets, validator, dataloader_creator
-        )
+    # the models don't depend on the target domain,
+    # so the best model is loaded once and evaluated on every target domain
+    (
+        framework,
+        adapter,
+        _,
+        dataloader_creator,
+        validator,
+        checkpoint_fn,
+        _,
+        _,
+        _,
+    ) = get_adapter_datasets_etc(cfg, exp_path, cfg.target_domains[:1], trial)
+    adapter = framework(adapter, checkpoint_fn=checkpoint_fn)
+    validator = validator.validator  # don't need ScoreHistory
+    datasets_per_domain = {d: get_datasets(cfg, [d]) for d in cfg.target_domains}
+    scores = main_utils.evaluate(
+        adapter, datasets_per_domain, validator, dataloader_creator
+    )
 
     filename = f"best_model_{cfg.validator}_{'_'.join(cfg.target_domains)}.json"
     with open(os.path.join(original_exp_path, filename), "w") as f:
         json.dump(scores, f, indent=2)
 
 
+# The datasets are only created once per process,
+# since they're the same for every trial.
+def get_datasets(cfg, target_domains):
+    args = [
+        cfg.dataset,
+        cfg.src_domains,
+        target_domains,
+        cfg.pretrain_on_src,
+        cfg.dataset_folder,
+        cfg.download_datasets,
+        cfg.evaluate,
+        cfg.image_cache_folder,
+        cfg.num_workers,
+        cfg.batch_augmentation,
+    ]
+    return process_cache.get_or_create(
+        ("datasets", args), lambda: main_utils.get_datasets(*args)
+    )
+
+
 def get_adapter_datasets_etc(
     cfg,
     exp_path,
@@ -107,23 +157,22 @@ def get_adapter_datasets_etc(
     num_classes = dataset_utils.num_classes(cfg.dataset)
 
     validator, checkpoint_fn = get_validator(
-        num_classes, cfg.validator, checkpoint_path
+        num_classes,
+        cfg.validator,
+        checkpoint_path,
+        resumable=cfg.resume_trials or cfg.successive_halving_rungs > 1,
+        async_checkpoints=cfg.async_checkpoints,
+        best_only_checkpoints=cfg.best_only_checkpoints,
     )
 
     configerer = getattr(configs, cfg.adapter)(trial)
-    datasets = main_utils.get_datasets(
-        cfg.dataset,
-        cfg.src_domains,
-        target_domains,
-        cfg.pretrain_on_src,
-        cfg.dataset_folder,
-        cfg.download_datasets,
-        cfg.evaluate,
-    )
+    datasets = get_datasets(cfg, target_domains)
 
     dataloader_creator = main_utils.get_dataloader_creator(
         cfg.batch_size,
         cfg.num_workers,
+        cfg.batch_augmentation,
+        get_multiprocessing_context(cfg),
     )
 
     models, framework = configerer.get_models(
@@ -150,6 +199,16 @@ def get_adapter_datasets_etc(
         cfg.use_full_inference,
         datasets=datasets,
     )
+    # The adapter is created with the full datasets, because some adapters
+    # like ATDOC have a memory bank with one entry per target_train sample.
+    # Only the datasets used for the dataloaders are subsampled.
+    if not cfg.evaluate:
+        datasets = main_utils.subsample_val_datasets(
+            datasets,
+            cfg.val_subsample_splits,
+            cfg.val_subsample_size,
+            cfg.val_subsample_seed,
+        )
     logger = Logger(os.path.join(exp_path, "logs"))
 
     if (len(trial.params) - num_fixed_params) > 5:
@@ -168,15 +227,35 @@ def get_adapter_datasets_etc(
     )
 
 
-def objective(cfg, root_exp_path, trial, reproduce_iter=None, num_fixed_params=0):
+# If stop_epoch is less than max_epochs, training stops early without deleting
+# the last checkpoint, and the trial can be continued by calling this again with resume=True.
+def objective(
+    cfg,
+    root_exp_path,
+    trial,
+    reproduce_iter=None,
+    num_fixed_params=0,
+    stop_epoch=None,
+    resume=False,
+    train_dataloader=None,
+):
     if reproduce_iter is not None:
         trial_name = f"reproduction{reproduce_iter}"
     else:
         trial_name = str(trial.number)
     exp_path = os.path.join(root_exp_path, trial_name)
     config_path = os.path.join(exp_path, "configs")
+    resume_file = None
     if os.path.isdir(exp_path):
-        shutil.rmtree(exp_path)
+        if cfg.resume_trials or resume:
+            resume_file = ignite_resume.get_last_checkpoint(exp_path)
+        if resume_file and not ignite_resume.truncate_features(
+            exp_path, ignite_resume.checkpoint_epoch(resume_file)
+        ):
+            resume_file = None
+        if resume_file is None:
+            shutil.rmtree(exp_path)
+    write_heartbeat(root_exp_path, trial=trial_name, iteration=0, epoch=0)
 
     (
         framework,
@@ -207,8 +286,20 @@ def objective(cfg, root_exp_path, trial, reproduce_iter=None, num_fixed_params=0
         use_stat_getter=cfg.use_stat_getter,
         save_features=cfg.save_features,
         save_features_cls=save_features_cls,
+        online_validators=cfg.online_validators,
     )
-
+    telemetry = PerfTelemetry(
+        exp_path, process_peaks=cfg.trials_per_process == 1
+    )
+    val_hooks = telemetry.wrap_val_hooks(val_hooks)
+    heartbeat = Heartbeat(root_exp_path, trial_name)
+    val_hooks = heartbeat.wrap_val_hooks(val_hooks)
+
+    if cfg.dedup_inference:
+        framework = with_dedup_inference(framework)
+    val_schedule = get_val_schedule(cfg)
+    if val_schedule:
+        framework = with_val_schedule(framework, val_schedule)
     adapter = framework(
         adapter,
         validator=validator,
@@ -217,24 +308,78 @@ def objective(cfg, root_exp_path, trial, reproduce_iter=None, num_fixed_params=0
         logger=logger,
         log_freq=1,
     )
+    heartbeat.attach(adapter)
+    if val_schedule:
+        val_schedule.attach(adapter)
+    pruner = None
+    if validator is not None and cfg.pruner != "none":
+        pruner = EpochPruner(trial, validator)
+        pruner.attach(adapter)
+    watchdog = None
+    if cfg.loss_watchdog:
+        watchdog = LossWatchdog(
+            logger, config_path, cfg.watchdog_window, cfg.divergence_factor
+        )
+        watchdog.attach(adapter)
+    if stop_epoch is not None and stop_epoch < cfg.max_epochs:
+        StopAtEpoch(stop_epoch).attach(adapter)
+    # attached last, so that its end of epoch handler runs after all the others
+    telemetry.attach(adapter)
+    if resume_file:
+        ignite_resume.resume_trial(adapter, checkpoint_fn, resume_file)
+        telemetry.load(ignite_resume.checkpoint_epoch(resume_file))
+    if cfg.best_only_checkpoints and checkpoint_fn is not None:
+        checkpoint_fn.min_score = get_min_score(trial)
 
     configerer.save(config_path)
     main_utils.save_argparse_and_trial_params(cfg, trial, config_path)
     main_utils.save_this_file(__file__, config_path)
+    heartbeat.beat(force=True)
 
     early_stopper_kwargs = None
     if cfg.patience:
         early_stopper_kwargs = {"patience": cfg.patience}
 
-    best_score, _ = adapter.run(
-        datasets=datasets,
-        dataloader_creator=dataloader_creator,
-        max_epochs=cfg.max_epochs,
-        early_stopper_kwargs=early_stopper_kwargs,
-        val_interval=cfg.val_interval,
-        check_initial_score=cfg.check_initial_score,
-        epoch_length=cfg.epoch_length,
+    run_kwargs = {"datasets": datasets, "dataloader_creator": dataloader_creator}
+    if train_dataloader is not None:
+        dataloaders = dataloader_creator(**datasets)
+        dataloaders["train"] = train_dataloader
+        run_kwargs = {"dataloaders": dataloaders}
+
+    try:
+        best_score, _ = adapter.run(
+            **run_kwargs,
+            max_epochs=cfg.max_epochs,
+            early_stopper_kwargs=early_stopper_kwargs,
+            val_interval=cfg.val_interval,
+            check_initial_score=cfg.check_initial_score,
+            epoch_length=cfg.epoch_length,
+        )
+    finally:
+        # so that no checkpoints are written after this,
+        # for example while the last checkpoints are being deleted
+        if cfg.async_checkpoints and checkpoint_fn is not None:
+            checkpoint_fn.flush()
+    logger.flush()
+    telemetry.write()
+    # these become columns of trials.csv
+    for k, v in telemetry.summary().items():
+        trial.set_user_attr(f"perf_{k}", v)
+    stopped_early = stop_epoch is not None and not ignite_utils.is_done(
+        adapter.trainer, cfg.max_epochs
     )
+    if not stopped_early:
+        ignite_resume.delete_last_checkpoints(exp_path)
+        for h in val_hooks:
+            if hasattr(h, "save_final_scores"):
+                h.save_final_scores()
+
+    if watchdog and watchdog.failure_reason:
+        trial.set_user_attr("failure_reason", watchdog.failure_reason)
+        return float("nan")
+
+    if pruner and pruner.pruned:
+        raise optuna.TrialPruned()
 
     if validator is None:
         if not ignite_utils.is_done(adapter.trainer, cfg.max_epochs):
@@ -247,42 +392,202 @@ def objective(cfg, root_exp_path, trial, reproduce_iter=None, num_fixed_params=0
     return best_score
 
 
-def hyperparam_search(cfg, exp_path):
+def get_fixed_params(cfg):
+    if not cfg.fixed_param_source:
+        return None
+    fp_source_path = os.path.join(cfg.exp_folder, cfg.fixed_param_source)
+    fp_source_best_trial_json = os.path.join(fp_source_path, BEST_TRIAL_FILENAME)
+    if not os.path.isfile(fp_source_best_trial_json):
+        FileNotFoundError(
+            "Fixed param source needs to be complete to use its best params"
+        )
+    fp_source_path = os.path.join(fp_source_path, "study.pkl")
+    fp_source_study = joblib.load(fp_source_path)
+    return fp_source_study.best_params
+
+
+# pruned trials count towards num_trials, failed trials don't
+def num_trials_complete(study):
+    return len([st for st in study.trials if is_complete_or_pruned(st)])
+
+
+def is_complete_or_pruned(trial):
+    return trial.state in [TrialState.COMPLETE, TrialState.PRUNED]
+
+
+# Every trial is appended to the journal,
+# but study.pkl and trials.csv are only rewritten every compaction_interval trials.
+def get_callbacks(save_study_fn, exp_path, plot_fn, log_path, compaction_interval):
+    return [
+        heartbeat_callback(exp_path),
+        main_utils.append_to_trials_journal(exp_path),
+        main_utils.every_n_trials(
+            compaction_interval, [save_study_fn, main_utils.save_dataframe(log_path)]
+        ),
+        plot_fn,
+        main_utils.delete_suboptimal_models(exp_path),
+        main_utils.delete_failed_features(exp_path),
+        heartbeat_callback(exp_path),
+    ]
+
+
+def get_plot_fn(cfg, exp_path):
+    return main_utils.plot_visualizations(
+        os.path.join(exp_path, "plots"), cfg.plot_interval, cfg.plot_in_background
+    )
+
+
+def compact(study, exp_path):
+    main_utils.save_study(os.path.join(exp_path, "study.pkl"))(study, None)
+    main_utils.save_dataframe(os.path.join(exp_path, TRIALS_FILENAME))(study, None)
+
+
+def parallel_trial_worker(cfg, exp_path, seed, devices, num_threads):
+    if devices is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = devices
+    torch.set_num_threads(num_threads)
     optuna.logging.set_verbosity(optuna.logging.WARNING)
     study_path = os.path.join(exp_path, "study.pkl")
-    plot_path = os.path.join(exp_path, "plots")
     log_path = os.path.join(exp_path, TRIALS_FILENAME)
 
+    storage = main_utils.get_study_storage(exp_path)
+    # constant_liar makes concurrent workers avoid suggesting the same params
+    sampler = TPESampler(
+        n_startup_trials=cfg.n_startup_trials, constant_liar=True, seed=seed
+    )
+    sampler = get_warm_start_sampler(cfg, sampler)
+    fixed_params = get_fixed_params(cfg)
+    num_fixed_params = 0
+    if fixed_params:
+        sampler = PartialFixedSampler(fixed_params, sampler)
+        num_fixed_params = len(fixed_params)
+    study = optuna.load_study(
+        study_name=main_utils.STUDY_NAME,
+        storage=storage,
+        sampler=sampler,
+        pruner=get_pruner(cfg),
+    )
+
+    # the callbacks read and write shared files, so only one worker runs them at a time
+    callbacks = get_callbacks(
+        main_utils.save_study_copy(study_path, storage),
+        exp_path,
+        get_plot_fn(cfg, exp_path),
+        log_path,
+        cfg.compaction_interval,
+    )
+    callbacks = [main_utils.locked(exp_path, callbacks)]
+    while True:
+        trial = main_utils.ask_within_budget(study, exp_path, cfg.num_trials)
+        if trial is None:
+            break
+        try:
+            score = objective(cfg, exp_path, trial, num_fixed_params=num_fixed_params)
+        except optuna.TrialPruned:
+            tell_and_run_callbacks(study, trial, callbacks, state=TrialState.PRUNED)
+            continue
+        except Exception:
+            tell_and_run_callbacks(study, trial, callbacks, state=TrialState.FAIL)
+            raise
+        finally:
+            gc.collect()
+        if np.isnan(score):
+            tell_and_run_callbacks(study, trial, callbacks, state=TrialState.FAIL)
+        else:
+            tell_and_run_callbacks(study, trial, callbacks, values=score)
+
+
+def parallel_search(cfg, exp_path):
+    c_f.makedir_if_not_there(exp_path)
+    c_f.makedir_if_not_there(os.path.join(exp_path, "plots"))
+    storage = main_utils.get_study_storage(exp_path)
+    study = optuna.create_study(
+        study_name=main_utils.STUDY_NAME,
+        storage=storage,
+        direction="maximize",
+        pruner=get_pruner(cfg),
+        load_if_exists=True,
+    )
+    # trials left running by an interrupted search will never finish
+    for st in study.trials:
+        if st.state == TrialState.RUNNING:
+            print(f"marking interrupted trial {st.number} as failed")
+            study.tell(st.number, state=TrialState.FAIL)
+    write_heartbeat(exp_path, trial=None, iteration=0, epoch=0)
+    print(f"{num_trials_complete(study)} trials already complete")
+
+    num_workers = cfg.num_parallel_trials
+    num_threads = max(1, os.cpu_count() // num_workers)
+    seeds = np.random.SeedSequence().generate_state(num_workers)
+    ctx = torch.multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(num_workers):
+        devices = main_utils.get_worker_devices(i)
+        p = ctx.Process(
+            target=parallel_trial_worker,
+            args=(cfg, exp_path, int(seeds[i]), devices, num_threads),
+        )
+        p.start()
+        workers.append(p)
+    for p in workers:
+        p.join()
+
+    study = main_utils.in_memory_study_copy(storage)
+    compact(study, exp_path)
+    get_plot_fn(cfg, exp_path)(study, None)
+    fixed_params = get_fixed_params(cfg)
+    num_fixed_params = len(fixed_params) if fixed_params else 0
+    return study, num_fixed_params
+
+
+def load_serial_study(cfg, exp_path):
+    study_path = os.path.join(exp_path, "study.pkl")
+    plot_path = os.path.join(exp_path, "plots")
+
     if os.path.isdir(exp_path) and os.path.isfile(study_path):
         study = joblib.load(study_path)
+        main_utils.replay_trials_journal(study, exp_path)
     else:
         c_f.makedir_if_not_there(exp_path)
         c_f.makedir_if_not_there(plot_path)
-        pruner = optuna.pruners.NopPruner()
+        sampler = TPESampler(n_startup_trials=cfg.n_startup_trials)
         study = optuna.create_study(
             direction="maximize",
-            pruner=pruner,
-            sampler=TPESampler(n_startup_trials=cfg.n_startup_trials),
+            sampler=get_warm_start_sampler(cfg, sampler),
         )
+    study.pruner = get_pruner(cfg)
+    write_heartbeat(exp_path, trial=None, iteration=0, epoch=0)
 
     num_fixed_params = 0
-    if cfg.fixed_param_source:
-        fp_source_path = os.path.join(cfg.exp_folder, cfg.fixed_param_source)
-        fp_source_best_trial_json = os.path.join(fp_source_path, BEST_TRIAL_FILENAME)
-        if not os.path.isfile(fp_source_best_trial_json):
-            FileNotFoundError(
-                "Fixed param source needs to be complete to use its best params"
-            )
-        fp_source_path = os.path.join(fp_source_path, "study.pkl")
-        fp_source_study = joblib.load(fp_source_path)
-        study.sampler = PartialFixedSampler(fp_source_study.best_params, study.sampler)
-        num_fixed_params = len(fp_source_study.best_params)
-
-    i = len([st for st in study.trials if st.state == TrialState.COMPLETE])
-    print(f"{i} trials already complete")
+    fixed_params = get_fixed_params(cfg)
+    if fixed_params:
+        study.sampler = PartialFixedSampler(fixed_params, study.sampler)
+        num_fixed_params = len(fixed_params)
 
     study.sampler.reseed_rng()
+    return study, num_fixed_params
+
+
+def get_serial_callbacks(cfg, exp_path, plot_fn):
+    return get_callbacks(
+        main_utils.save_study(os.path.join(exp_path, "study.pkl")),
+        exp_path,
+        plot_fn,
+        os.path.join(exp_path, TRIALS_FILENAME),
+        cfg.compaction_interval,
+    )
+
+
+def serial_search(cfg, exp_path):
+    study, num_fixed_params = load_serial_study(cfg, exp_path)
+    if cfg.resume_trials:
+        ignite_resume.enqueue_interrupted_trial(study, exp_path)
+
+    i = num_trials_complete(study)
+    print(f"{i} trials already complete")
 
+    plot_fn = get_plot_fn(cfg, exp_path)
+    callbacks = get_serial_callbacks(cfg, exp_path, plot_fn)
     while i < cfg.num_trials:
         study.optimize(
             lambda trial: objective(
@@ -290,26 +595,184 @@ def hyperparam_search(cfg, exp_path):
             ),
             n_trials=1,
             timeout=None,
-            callbacks=[
-                main_utils.save_study(study_path),
-                main_utils.plot_visualizations(plot_path),
-                main_utils.save_dataframe(log_path),
-                main_utils.delete_suboptimal_models(exp_path),
-                main_utils.delete_failed_features(exp_path),
-            ],
+            callbacks=callbacks,
             gc_after_trial=True,
         )
-        if study.trials[-1].state == TrialState.COMPLETE:
-            print("trial completed successfully, incrementing counter")
+        if is_complete_or_pruned(study.trials[-1]):
+            print(f"trial {study.trials[-1].state.name}, incrementing counter")
             i += 1
 
+    compact(study, exp_path)
+    plot_fn(study, None)
+    return study, num_fixed_params
+
+
+def tell_and_run_callbacks(study, trial, callbacks, **kwargs):
+    study.tell(trial, **kwargs)
+    frozen_trial = study.trials[trial.number]
+    for c in callbacks:
+        c(study, frozen_trial)
+
+
+# Synchronous successive halving: all remaining trials train for the first rung's epochs,
+# then the top 1/eta of them continue from their checkpoints to the next rung, and so on.
+# Trials that aren't promoted are marked as pruned.
+def successive_halving_search(cfg, exp_path):
+    study, num_fixed_params = load_serial_study(cfg, exp_path)
+    # trials that were waiting to be promoted when the search was interrupted
+    for st in study.trials:
+        if st.state == TrialState.RUNNING:
+            print(f"marking interrupted trial {st.number} as failed")
+            study.tell(st.number, state=TrialState.FAIL)
+            ignite_resume.delete_last_checkpoints(
+                os.path.join(exp_path, str(st.number))
+            )
+
+    num_trials = cfg.num_trials - num_trials_complete(study)
+    print(f"{cfg.num_trials - num_trials} trials already complete")
+    rung_epochs = get_rung_epochs(
+        cfg.max_epochs,
+        cfg.val_interval,
+        cfg.successive_halving_rungs,
+        cfg.successive_halving_eta,
+    )
+    print("rung_epochs", rung_epochs)
+
+    plot_fn = get_plot_fn(cfg, exp_path)
+    callbacks = get_serial_callbacks(cfg, exp_path, plot_fn)
+    trials = [study.ask() for _ in range(max(0, num_trials))]
+    for r, stop_epoch in enumerate(rung_epochs):
+        write_heartbeat(exp_path, trial=None, iteration=0, epoch=0)
+        scores = {}
+        for trial in trials:
+            score = objective(
+                cfg,
+                exp_path,
+                trial,
+                num_fixed_params=num_fixed_params,
+                stop_epoch=stop_epoch,
+                resume=r > 0,
+            )
+            if np.isnan(score):
+                tell_and_run_callbacks(
+                    study, trial, callbacks, state=TrialState.FAIL
+                )
+                continue
+            trial.report(score, stop_epoch)
+            scores[trial] = score
+
+        if stop_epoch == rung_epochs[-1]:
+            for trial, score in scores.items():
+                tell_and_run_callbacks(study, trial, callbacks, values=score)
+            break
+
+        promoted = get_promoted(scores, cfg.successive_halving_eta)
+        for trial in scores:
+            if trial not in promoted:
+                ignite_resume.delete_last_checkpoints(
+                    os.path.join(exp_path, str(trial.number))
+                )
+                tell_and_run_callbacks(
+                    study, trial, callbacks, state=TrialState.PRUNED
+                )
+        print(f"promoting trials {[t.number for t in promoted]} to rung {r + 1}")
+        trials = promoted
+
+    compact(study, exp_path)
+    plot_fn(study, None)
+    return study, num_fixed_params
+
+
+# In batched_search, every dataloader is iterated while the trial threads are running,
+# and forking dataloader workers from a multithreaded process can deadlock.
+def get_multiprocessing_context(cfg):
+    return "spawn" if cfg.trials_per_process > 1 else None
+
+
+def get_shared_batches(cfg, num_consumers):
+    datasets = get_datasets(cfg, cfg.target_domains)
+    dataloader_creator = main_utils.get_dataloader_creator(
+        cfg.batch_size,
+        cfg.num_workers,
+        cfg.batch_augmentation,
+        get_multiprocessing_context(cfg),
+    )
+    train_dataloader = dataloader_creator(train=datasets["train"])["train"]
+    return SharedBatches(train_dataloader, num_consumers)
+
+
+# Experimental: trains several trials at the same time, each in its own thread,
+# all using the same training batches. This is meant for small models like mnist,
+# where one trial per process leaves most of the machine idle.
+def batched_search(cfg, exp_path):
+    study, num_fixed_params = load_serial_study(cfg, exp_path)
+    i = num_trials_complete(study)
+    print(f"{i} trials already complete")
+    torch.set_num_threads(max(1, torch.get_num_threads() // cfg.trials_per_process))
+
+    plot_fn = get_plot_fn(cfg, exp_path)
+    callbacks = get_serial_callbacks(cfg, exp_path, plot_fn)
+    while i < cfg.num_trials:
+        num_trials = min(cfg.trials_per_process, cfg.num_trials - i)
+        trials = [study.ask() for _ in range(num_trials)]
+        shared_batches = get_shared_batches(cfg, len(trials))
+        results = [None] * len(trials)
+
+        def run(j):
+            try:
+                results[j] = objective(
+                    cfg,
+                    exp_path,
+                    trials[j],
+                    num_fixed_params=num_fixed_params,
+                    train_dataloader=shared_batches.consumers[j],
+                )
+            except Exception as e:
+                results[j] = e
+            finally:
+                shared_batches.close(j)
+
+        threads = [
+            threading.Thread(target=run, args=(j,)) for j in range(len(trials))
+        ]
+        for t in threads:
+            t.start()
+        shared_batches.start()
+        for t in threads:
+            t.join()
+
+        for trial, result in zip(trials, results):
+            if isinstance(result, optuna.TrialPruned):
+                tell_and_run_callbacks(
+                    study, trial, callbacks, state=TrialState.PRUNED
+                )
+            elif isinstance(result, Exception) or np.isnan(result):
+                tell_and_run_callbacks(
+                    study, trial, callbacks, state=TrialState.FAIL
+                )
+            else:
+                tell_and_run_callbacks(study, trial, callbacks, values=result)
+            if is_complete_or_pruned(study.trials[trial.number]):
+                i += 1
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(
+                result, optuna.TrialPruned
+            ):
+                raise result
+
+    compact(study, exp_path)
+    plot_fn(study, None)
+    return study, num_fixed_params
+
+
+def serial_reproductions(cfg, exp_path, params, num_fixed_params):
     i = main_utils.num_repro_complete(exp_path)
     print("num_reproduce_complete", i)
     while i < cfg.num_reproduce:
         result = objective(
             cfg,
             exp_path,
-            optuna.trial.FixedTrial(study.best_trial.params),
+            optuna.trial.FixedTrial(params),
             i,
             num_fixed_params=num_fixed_params,
         )
@@ -317,6 +780,72 @@ def hyperparam_search(cfg, exp_path):
             main_utils.update_repro_file(exp_path)
             i += 1
 
+
+# Exits with 0 if the reproduction succeeded, and 2 if its score is nan.
+def reproduction_worker(
+    cfg, exp_path, params, reproduce_iter, num_fixed_params, devices, num_threads
+):
+    if devices is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = devices
+    torch.set_num_threads(num_threads)
+    result = objective(
+        cfg,
+        exp_path,
+        optuna.trial.FixedTrial(params),
+        reproduce_iter,
+        num_fixed_params=num_fixed_params,
+    )
+    sys.exit(2 if np.isnan(result) else 0)
+
+
+# Runs up to num_parallel_reproductions at the same time, each in its own process.
+# Reproductions with a nan score are run again in the next round.
+# num_repro_complete.json only counts the reproductions numbered 0 to n-1
+# that have all succeeded, so an interrupted run continues from there.
+def parallel_reproductions(cfg, exp_path, params, num_fixed_params):
+    succeeded = set(range(main_utils.num_repro_complete(exp_path)))
+    print("num_reproduce_complete", len(succeeded))
+    ctx = torch.multiprocessing.get_context("spawn")
+    while len(succeeded) < cfg.num_reproduce:
+        todo = [i for i in range(cfg.num_reproduce) if i not in succeeded]
+        todo = todo[: cfg.num_parallel_reproductions]
+        num_threads = max(1, os.cpu_count() // len(todo))
+        workers = {}
+        for j, i in enumerate(todo):
+            devices = main_utils.get_worker_devices(j)
+            args = (cfg, exp_path, params, i, num_fixed_params, devices, num_threads)
+            workers[i] = ctx.Process(target=reproduction_worker, args=args)
+            workers[i].start()
+        for p in workers.values():
+            p.join()
+        failed = {}
+        for i, p in workers.items():
+            if p.exitcode == 0:
+                succeeded.add(i)
+            elif p.exitcode != 2:
+                failed[i] = p.exitcode
+        while main_utils.num_repro_complete(exp_path) in succeeded:
+            main_utils.update_repro_file(exp_path)
+        if len(failed) > 0:
+            raise RuntimeError(f"reproductions exited with codes {failed}")
+
+
+def hyperparam_search(cfg, exp_path):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    if cfg.num_parallel_trials > 1:
+        study, num_fixed_params = parallel_search(cfg, exp_path)
+    elif cfg.successive_halving_rungs > 1:
+        study, num_fixed_params = successive_halving_search(cfg, exp_path)
+    elif cfg.trials_per_process > 1:
+        study, num_fixed_params = batched_search(cfg, exp_path)
+    else:
+        study, num_fixed_params = serial_search(cfg, exp_path)
+
+    if cfg.num_parallel_reproductions > 1:
+        parallel_reproductions(cfg, exp_path, study.best_trial.params, num_fixed_params)
+    else:
+        serial_reproductions(cfg, exp_path, study.best_trial.params, num_fixed_params)
+
     best_json = {
         field: str(getattr(study.best_trial, field))
         for field in study.best_trial._ordered_fields
@@ -346,6 +875,12 @@ if __name__ == "__main__":
     parser.add_argument("--epoch_length", type=int, default=None)
     parser.add_argument("--patience", type=int, default=None)
     parser.add_argument("--val_interval", type=int, default=1)
+    parser.add_argument(
+        "--val_schedule", type=str, choices=VAL_SCHEDULES, default="fixed"
+    )
+    parser.add_argument("--val_schedule_ratio", type=float, default=2)
+    parser.add_argument("--val_epochs", nargs="+", type=int, default=None)
+    parser.add_argument("--val_loss_change", type=float, default=0.1)
     parser.add_argument("--batch_size", type=int, default=64)
     parser.add_argument("--num_workers", type=int, default=8)
     parser.add_argument("--num_trials", type=int, default=10)
@@ -355,16 +890,42 @@ if __name__ == "__main__":
     parser.add_argument("--multilabel", action="store_true")
     parser.add_argument("--evaluate", action="store_true")
     parser.add_argument("--num_reproduce", type=int, default=0)
+    parser.add_argument("--num_parallel_reproductions", type=int, default=1)
     parser.add_argument("--feature_layer", type=int, default=0)
     parser.add_argument("--optimizer", type=str, default="SGD")
     parser.add_argument("--lr_multiplier", type=float, default=1)
     parser.add_argument("--pretrain_lr", type=float, default=0.01)
     parser.add_argument("--fixed_param_source", type=str, default=None)
+    parser.add_argument("--warm_start_groups", nargs="+", default=[])
     parser.add_argument("--save_features", action="store_true")
+    parser.add_argument("--online_validators", nargs="+", default=[])
     parser.add_argument("--download_datasets", action="store_true")
+    parser.add_argument("--image_cache_folder", type=str, default=None)
+    parser.add_argument("--batch_augmentation", action="store_true")
+    parser.add_argument("--dedup_inference", action="store_true")
+    parser.add_argument("--val_subsample_size", type=int, default=None)
+    parser.add_argument("--val_subsample_splits", nargs="+", default=["src_train"])
+    parser.add_argument("--val_subsample_seed", type=int, default=0)
     parser.add_argument("--use_stat_getter", action="store_true")
     parser.add_argument("--check_initial_score", action="store_true")
     parser.add_argument("--use_full_inference", action="store_true")
+    parser.add_argument("--resume_trials", action="store_true")
+    parser.add_argument("--async_checkpoints", action="store_true")
+    parser.add_argument("--best_only_checkpoints", action="store_true")
+    parser.add_argument("--num_parallel_trials", type=int, default=1)
+    parser.add_argument("--compaction_interval", type=int, default=1)
+    parser.add_argument("--plot_interval", type=int, default=1)
+    parser.add_argument("--plot_in_background", action="store_true")
+    parser.add_argument("--pruner", type=str, choices=PRUNERS, default="none")
+    parser.add_argument("--pruner_startup_trials", type=int, default=5)
+    parser.add_argument("--pruner_warmup_epochs", type=int, default=0)
+    parser.add_argument("--pruner_percentile", type=float, default=25.0)
+    parser.add_argument("--loss_watchdog", action="store_true")
+    parser.add_argument("--watchdog_window", type=int, default=100)
+    parser.add_argument("--divergence_factor", type=float, default=1000)
+    parser.add_argument("--successive_halving_rungs", type=int, default=0)
+    parser.add_argument("--successive_halving_eta", type=int, default=3)
+    parser.add_argument("--trials_per_process", type=int, default=1)
     args = parser.parse_args()
     main_utils.args_check(args)
     main(args)
@@ -2,8 +2,17 @@
 
 input_folder=$1
 timeout=$2
-latest_dir=$(ls -td ${input_folder}/*/ | head -1)
-latest_update_time=$(find ${latest_dir} -printf "%T@\n" | sort | tail -1 | cut -f1 -d".")
+heartbeat_filename=$3
+heartbeat_file="${input_folder}/${heartbeat_filename}"
+if [ -n "${heartbeat_filename}" ] && [ -f "${heartbeat_file}" ];
+then
+    # the heartbeat is written by powerful_benchmarker/utils/heartbeat.py
+    latest_update_time=$(grep -o '"timestamp": [0-9]*' ${heartbeat_file} | grep -o '[0-9]*$')
+else
+    # fall back to the most recent modification time in the latest trial folder
+    latest_dir=$(ls -td ${input_folder}/*/ | head -1)
+    latest_update_time=$(find ${latest_dir} -printf "%T@\n" | sort | tail -1 | cut -f1 -d".")
+fi
 current_seconds=$(date +%s)
 time_since_latest_update=$((current_seconds - latest_update_time))
 # minutes_since_latest_update=$((time_since_latest_update / 60))
@@ -12,4 +21,4 @@ then
     echo 0;
 else
     echo 1;
-fi;
\ No newline at end of file
+fi;
@@ -7,7 +7,8 @@ full_path="$exp_folder/$exp_name/"
 conda_env=$4
 devices=$5
 best_trial_filename=$6
-command=$7
+heartbeat_filename=$7
+command=$8
 
 echo "Command to be wrapped: $command"
 
@@ -15,7 +16,10 @@ export CUDA_VISIBLE_DEVICES=${devices}
 
 echo "CUDA_VISIBLE_DEVICES=$CUDA_VISIBLE_DEVICES"
 
-conda deactivate && conda activate ${conda_env}
+# conda_env is "None" when it isn't set in constants.yaml (e.g. for local runs)
+if [ "${conda_env}" != "None" ]; then
+	conda deactivate && conda activate ${conda_env}
+fi
 
 best_trial_full_path="$full_path$best_trial_filename"
 
@@ -24,8 +28,8 @@ echo "Will run until this file is made: $best_trial_full_path"
 while [ ! -f $best_trial_full_path ]
 do
 	echo "STARTING $script_name"
-	echo "Checking folder: $full_path"
-	echo "Will kill script if folder has not updated in the past $timeout seconds"
+	echo "Checking heartbeat: $full_path$heartbeat_filename"
+	echo "Will kill script if heartbeat has not updated in the past $timeout seconds"
 	${command} & 
 	curr_pid=$!
 	is_running=1
@@ -37,7 +41,7 @@ do
 	do
 			sleep 1m
 			if [ -d "$full_path" ]; then
-				is_running=$(bash ./powerful_benchmarker/scripts/process_checker.sh ${full_path} ${timeout})
+				is_running=$(bash ./powerful_benchmarker/scripts/process_checker.sh ${full_path} ${timeout} ${heartbeat_filename})
 			fi
 	done
 	pkill -9 -P ${curr_pid}
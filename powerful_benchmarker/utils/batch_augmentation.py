@@ -0,0 +1,80 @@
+import torch
+import torchvision.transforms as T
+from pytorch_adapt.transforms.classification import get_resnet_transform
+from pytorch_adapt.transforms.constants import IMAGENET_MEAN, IMAGENET_STD
+from torch.utils.data.dataloader import default_collate
+
+
+# Per-sample work for training images is reduced to resizing,
+# and the images are kept as uint8.
+# The rest of get_resnet_transform is done by BatchAugmentation.
+def get_uint8_transform(is_training, **kwargs):
+    if not is_training:
+        return get_resnet_transform(is_training=is_training, **kwargs)
+    return T.Compose([T.Resize(256), T.PILToTensor()])
+
+
+# Images have different sizes after resizing the shorter side,
+# so they're padded to the largest height and width in the batch.
+# Returns the padded batch and the height and width of each image.
+def pad_and_stack(images):
+    height = max(x.shape[1] for x in images)
+    width = max(x.shape[2] for x in images)
+    output = images[0].new_zeros((len(images), images[0].shape[0], height, width))
+    for i, x in enumerate(images):
+        output[i, :, : x.shape[1], : x.shape[2]] = x
+    sizes = torch.tensor([tuple(x.shape[1:]) for x in images])
+    return output, sizes[:, 0], sizes[:, 1]
+
+
+# Each crop is within the image's own height and width,
+# so padding is never included, like T.RandomCrop on each image.
+def random_crop(x, size, heights=None, widths=None):
+    batch_size, _, height, width = x.shape
+    if heights is None:
+        heights = torch.full((batch_size,), height)
+    if widths is None:
+        widths = torch.full((batch_size,), width)
+    top = (torch.rand(batch_size) * (heights - size + 1)).long()
+    left = (torch.rand(batch_size) * (widths - size + 1)).long()
+    rows = top.view(batch_size, 1, 1) + torch.arange(size).view(1, size, 1)
+    cols = left.view(batch_size, 1, 1) + torch.arange(size).view(1, 1, size)
+    batch_idx = torch.arange(batch_size).view(batch_size, 1, 1)
+    # (batch_size, size, size, channels)
+    x = x.permute(0, 2, 3, 1)[batch_idx, rows, cols]
+    return x.permute(0, 3, 1, 2)
+
+
+def random_horizontal_flip(x):
+    flip = torch.rand(x.shape[0]) < 0.5
+    x = x.clone()
+    x[flip] = x[flip].flip(-1)
+    return x
+
+
+def normalize(x, mean, std):
+    mean = torch.tensor(mean).view(1, -1, 1, 1)
+    std = torch.tensor(std).view(1, -1, 1, 1)
+    return (x.float() / 255 - mean) / std
+
+
+# Used as the collate_fn of the training dataloader.
+# Every image in the batch gets its own random crop and flip,
+# so the result is the same as get_resnet_transform's training augmentation.
+class BatchAugmentation:
+    def __init__(self, crop_size=224, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.crop_size = crop_size
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, samples):
+        img_keys = [k for k in samples[0].keys() if k.endswith("_imgs")]
+        batch = default_collate(
+            [{k: v for k, v in x.items() if k not in img_keys} for x in samples]
+        )
+        for k in img_keys:
+            v, heights, widths = pad_and_stack([x[k] for x in samples])
+            v = random_crop(v, self.crop_size, heights, widths)
+            v = random_horizontal_flip(v)
+            batch[k] = normalize(v, self.mean, self.std)
+        return batch
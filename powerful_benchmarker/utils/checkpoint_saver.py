@@ -0,0 +1,171 @@
+import copy
+import os
+import queue
+import threading
+
+import torch
+from ignite.handlers import ModelCheckpoint
+from ignite.handlers.checkpoint import DiskSaver
+from pytorch_adapt.utils import common_functions as c_f
+
+
+# Copies every tensor to the cpu, so that training can continue
+# while the copy is being written.
+def snapshot(x):
+    if torch.is_tensor(x):
+        return x.detach().to("cpu", copy=True)
+    if isinstance(x, dict):
+        return type(x)((k, snapshot(v)) for k, v in x.items())
+    if isinstance(x, (list, tuple)):
+        return type(x)(snapshot(v) for v in x)
+    return copy.deepcopy(x)
+
+
+# Runs saves and removes in order on a single background thread.
+# At most max_pending snapshots are kept in memory,
+# after which the training thread waits for the writer.
+# The thread is started by the first put, and stopped by flush.
+class BackgroundWriter:
+    def __init__(self, max_pending=4):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = None
+
+    def run(self):
+        while True:
+            x = self.queue.get()
+            if x is None:
+                return
+            fn, args = x
+            try:
+                if self.error is None:
+                    fn(*args)
+            except Exception as e:
+                self.error = e
+
+    def put(self, fn, *args):
+        self.raise_error()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.queue.put((fn, args))
+
+    def flush(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+# A DiskSaver that writes on a BackgroundWriter,
+# so ModelCheckpoint.last_checkpoint still works.
+class BackgroundDiskSaver(DiskSaver):
+    def __init__(self, save_handler, writer):
+        super().__init__(
+            save_handler.dirname,
+            atomic=save_handler._atomic,
+            require_empty=False,
+            **save_handler.kwargs,
+        )
+        self.writer = writer
+
+    def __call__(self, checkpoint, filename, metadata=None):
+        self.writer.put(super().__call__, snapshot(checkpoint), filename, metadata)
+
+    def remove(self, filename):
+        self.writer.put(self.remove_if_exists, filename)
+
+    # ResumableCheckpointFnCreator may have already deleted stale files
+    def remove_if_exists(self, filename):
+        path = os.path.join(self.dirname, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+# If min_score is set, checkpoints with a score less than or equal to it
+# aren't saved, because they can't be the best checkpoint of the study.
+# They are skipped before Checkpoint adds them to its list of saved files,
+# so the list only has files that exist.
+class MinScoreModelCheckpoint(ModelCheckpoint):
+    def __init__(self, min_score=None, **kwargs):
+        super().__init__(**kwargs)
+        self.min_score = min_score
+
+    def __call__(self, engine, to_save):
+        if self.min_score is None or self.score_function is None:
+            return super().__call__(engine, to_save)
+        # the score function runs validation, so it's only called once
+        score_function = self.score_function
+        score = score_function(engine)
+        if score <= self.min_score:
+            c_f.LOGGER.info(
+                f"not saving epoch {engine.state.epoch}, its score is not above {self.min_score}"
+            )
+            return
+        self.score_function = lambda _: score
+        try:
+            super().__call__(engine, to_save)
+        finally:
+            self.score_function = score_function
+
+
+def with_checkpoint_saver(checkpoint_fn_cls):
+    class WithCheckpointSaver(checkpoint_fn_cls):
+        def __init__(self, background=False, **kwargs):
+            super().__init__(**kwargs)
+            self.writer = BackgroundWriter() if background else None
+            # set before training, to save only possible study-best checkpoints
+            self.min_score = None
+            self.ckpter.save_handler = self.get_save_handler(self.ckpter)
+            if hasattr(self, "last"):
+                self.last.save_handler = self.get_save_handler(self.last)
+
+        def __call__(self, *args, **kwargs):
+            fn = super().__call__(*args, **kwargs)
+            # self.objs is recreated in CheckpointFnCreator.__call__,
+            # and may have been restored from a checkpoint since then
+            objs = MinScoreModelCheckpoint(
+                self.min_score, **{**self.kwargs, **kwargs}
+            )
+            objs.load_state_dict(self.objs.state_dict())
+            objs.save_handler = self.get_save_handler(objs)
+            self.objs = objs
+            return fn
+
+        def get_save_handler(self, checkpointer):
+            if self.writer is None:
+                return checkpointer.save_handler
+            return BackgroundDiskSaver(checkpointer.save_handler, self.writer)
+
+        # The files to keep are decided now,
+        # but they are deleted after the pending writes.
+        def delete_stale_files(self):
+            if self.writer is None:
+                return super().delete_stale_files()
+            self.writer.put(self.delete_files_except, self.files_to_keep())
+
+        # waits for all checkpoints to be written
+        def flush(self):
+            if self.writer is not None:
+                self.writer.flush()
+
+    WithCheckpointSaver.__name__ = checkpoint_fn_cls.__name__
+    return WithCheckpointSaver
+
+
+# The best value of the study so far.
+# Other workers can only increase it, so it's safe to compare against.
+def get_min_score(trial):
+    study = getattr(trial, "study", None)
+    if study is None:
+        return None
+    try:
+        return study.best_value
+    except ValueError:
+        return None
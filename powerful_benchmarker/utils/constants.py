@@ -1,8 +1,13 @@
 import yaml
 
 TRIALS_FILENAME = "trials.csv"
+TRIALS_JOURNAL_FILENAME = "trials_journal.jsonl"
+FAILURE_REASON_FILENAME = "failure_reason.json"
 BEST_TRIAL_FILENAME = "best_trial.json"
 JOBIDS_FILENAME = "all_jobids.json"
+HEARTBEAT_FILENAME = "heartbeat.json"
+PERF_FILENAME = "perf.json"
+LOSSES_FILENAME = "losses.hdf5"
 
 
 def get_user_constants(constants_path):
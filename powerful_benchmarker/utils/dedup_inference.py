@@ -0,0 +1,99 @@
+from pytorch_adapt.frameworks.ignite import utils as ignite_utils
+from pytorch_adapt.utils import common_functions as c_f
+from pytorch_adapt.validators import utils as val_utils
+from torch.utils.data import Subset
+
+# The "_with_labels" splits contain the same images as the unlabeled splits,
+# so their collected outputs are the same, plus "labels".
+ALIASES = {
+    "target_train": "target_train_with_labels",
+    "target_val": "target_val_with_labels",
+}
+
+
+def inner_datasets(dataset):
+    dataset = dataset.dataset
+    return getattr(dataset, "datasets", [dataset])
+
+
+def same_samples(x, y):
+    if isinstance(x, Subset) or isinstance(y, Subset):
+        if not (isinstance(x, Subset) and isinstance(y, Subset)):
+            return False
+        same_indices = list(x.indices) == list(y.indices)
+        return same_indices and same_samples(x.dataset, y.dataset)
+    if len(x) != len(y) or x.domain != y.domain:
+        return False
+    for a, b in zip(inner_datasets(x), inner_datasets(y)):
+        if type(a) is not type(b) or len(a) != len(b):
+            return False
+        if getattr(a, "img_paths", None) != getattr(b, "img_paths", None):
+            return False
+    return True
+
+
+def get_aliases(dataloaders, required_data):
+    aliases = {}
+    for k, v in ALIASES.items():
+        if k in required_data and v in dataloaders:
+            if same_samples(dataloaders[k].dataset, dataloaders[v].dataset):
+                aliases[k] = v
+    return aliases
+
+
+# Same as ignite_utils.collect_from_dataloaders,
+# except each aliased split is copied from its "_with_labels" split.
+def collect_from_dataloaders(collector, dataloaders, required_data):
+    aliases = get_aliases(dataloaders, required_data)
+    to_collect = list(dict.fromkeys(aliases.get(k, k) for k in required_data))
+    collected_data = ignite_utils.collect_from_dataloaders(
+        collector, dataloaders, to_collect
+    )
+    for k, v in aliases.items():
+        c_f.LOGGER.info(f"Using {v} outputs for {k}")
+        collected_data[k] = {
+            name: x for name, x in collected_data[v].items() if name != "labels"
+        }
+    for k in set(collected_data) - set(required_data):
+        del collected_data[k]
+    return collected_data
+
+
+# Same as ignite_utils.get_validation_runner, but with deduplicated collection
+def get_validation_runner(collector, dataloaders, validator, val_hooks, logger):
+    required_data = []
+    for v in [validator, *val_hooks]:
+        if v and hasattr(v, "required_data"):
+            required_data = list(set(required_data + v.required_data))
+
+    def run_validation(engine):
+        epoch = engine.state.epoch
+        collected_data = collect_from_dataloaders(
+            collector, dataloaders, required_data
+        )
+        score = None
+        if validator:
+            score = val_utils.call_val_hook(validator, collected_data, epoch)
+        for hook in val_hooks:
+            val_utils.call_val_hook(hook, collected_data, epoch)
+        if logger:
+            logger.add_validation({"validator": validator}, epoch)
+            logger.write(engine)
+        return score
+
+    return run_validation
+
+
+def with_dedup_inference(framework_cls):
+    class DedupInference(framework_cls):
+        def get_validation_runner(self, dataloaders):
+            return get_validation_runner(
+                self.collector,
+                dataloaders,
+                self.validator,
+                self.val_hooks,
+                self.logger,
+            )
+
+    DedupInference.__name__ = framework_cls.__name__
+    return DedupInference
@@ -1,6 +1,9 @@
 from pytorch_adapt.frameworks.ignite import CheckpointFnCreator
 from pytorch_adapt.validators import AccuracyValidator, APValidator, ScoreHistory
 
+from .checkpoint_saver import with_checkpoint_saver
+from .ignite_resume import ResumableCheckpointFnCreator
+
 
 def get_validator_cls_and_kwargs(num_classes, average, multilabel):
     kwargs = {"num_classes": num_classes, "average": average}
@@ -31,6 +34,9 @@ def get_validator(
     num_classes,
     validator_name,
     checkpoint_path,
+    resumable=False,
+    async_checkpoints=False,
+    best_only_checkpoints=False,
 ):
     if validator_name is None:
         return None, None
@@ -59,5 +65,12 @@ def get_validator(
         raise ValueError
 
     validator = ScoreHistory(validator, ignore_epoch=0)
-    checkpoint_fn = CheckpointFnCreator(dirname=checkpoint_path, require_empty=False)
+    checkpoint_fn_cls = (
+        ResumableCheckpointFnCreator if resumable else CheckpointFnCreator
+    )
+    kwargs = {"dirname": checkpoint_path, "require_empty": False}
+    if async_checkpoints or best_only_checkpoints:
+        checkpoint_fn_cls = with_checkpoint_saver(checkpoint_fn_cls)
+        kwargs["background"] = async_checkpoints
+    checkpoint_fn = checkpoint_fn_cls(**kwargs)
     return validator, checkpoint_fn
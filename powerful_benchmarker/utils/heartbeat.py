@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+from ignite.engine import Events
+
+from .constants import HEARTBEAT_FILENAME
+
+
+# Written atomically, so the supervisor never reads a partial file.
+# The supervisor (scripts/process_checker.sh) only reads this file,
+# instead of scanning the whole experiment folder.
+def write_heartbeat(folder, **kwargs):
+    filepath = os.path.join(folder, HEARTBEAT_FILENAME)
+    temp_filepath = f"{filepath}.{os.getpid()}_{threading.get_ident()}.tmp"
+    with open(temp_filepath, "w") as f:
+        json.dump({**kwargs, "timestamp": int(time.time())}, f)
+    os.replace(temp_filepath, filepath)
+
+
+# Beats before and after a val hook, like OnlineValidators or SaveFeatures,
+# which can take a long time without any engine iterating.
+# Otherwise behaves like the hook, so it's still saved in checkpoints.
+class HeartbeatValHook:
+    def __init__(self, hook, heartbeat):
+        self.hook = hook
+        self.heartbeat = heartbeat
+
+    def __call__(self, *args, **kwargs):
+        self.heartbeat.beat(force=True)
+        output = self.hook(*args, **kwargs)
+        self.heartbeat.beat(force=True)
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["hook"], name)
+
+
+# Beats during training and validation iterations (at most every min_interval),
+# and at the start and end of training and of every epoch.
+# The end of epoch beats are before and after validation and checkpointing.
+class Heartbeat:
+    def __init__(self, folder, trial_name, min_interval=10):
+        self.folder = folder
+        self.trial_name = trial_name
+        self.min_interval = min_interval
+        self.last_write = 0
+        self.state = None
+
+    def attach(self, framework):
+        trainer = framework.trainer
+        self.state = trainer.state
+
+        def fn(engine):
+            self.beat()
+
+        def force_fn(engine):
+            self.beat(force=True)
+
+        # the collector runs during validation, when the trainer isn't iterating
+        for engine in [trainer, framework.collector]:
+            engine.add_event_handler(Events.ITERATION_COMPLETED, fn)
+        for event in [
+            Events.STARTED,
+            Events.EPOCH_STARTED,
+            Events.EPOCH_COMPLETED,
+            Events.COMPLETED,
+        ]:
+            trainer.add_event_handler(event, force_fn)
+
+        def end_epoch_fn(engine):
+            self.beat(force=True)
+
+        # framework.run() adds the validation and checkpoint handlers
+        # after STARTED, so this runs after them
+        def add_end_epoch(engine):
+            if trainer.has_event_handler(end_epoch_fn, Events.EPOCH_COMPLETED):
+                trainer.remove_event_handler(end_epoch_fn, Events.EPOCH_COMPLETED)
+            trainer.add_event_handler(Events.EPOCH_COMPLETED, end_epoch_fn)
+
+        trainer.add_event_handler(Events.STARTED, add_end_epoch)
+
+    def wrap_val_hooks(self, val_hooks):
+        return [HeartbeatValHook(h, self) for h in val_hooks]
+
+    def beat(self, force=False):
+        now = time.time()
+        if not force and now - self.last_write < self.min_interval:
+            return
+        iteration, epoch = 0, 0
+        if self.state is not None:
+            iteration, epoch = self.state.iteration, self.state.epoch
+        write_heartbeat(
+            self.folder, trial=self.trial_name, iteration=iteration, epoch=epoch
+        )
+        self.last_write = now
+
+
+# An optuna callback, for the time between trials,
+# when the study is saved and plotted.
+def heartbeat_callback(folder):
+    def fn(study, frozen_trial):
+        write_heartbeat(folder, trial=str(frozen_trial.number), iteration=0, epoch=0)
+
+    return fn
@@ -0,0 +1,158 @@
+import glob
+import json
+import os
+from pathlib import Path
+
+import h5py
+import torch
+from ignite.engine import Events
+from ignite.handlers import ModelCheckpoint
+from pytorch_adapt.frameworks.ignite import CheckpointFnCreator
+from pytorch_adapt.frameworks.ignite import utils as ignite_utils
+from pytorch_adapt.frameworks.ignite.checkpoint_utils import (
+    adapter_to_dict,
+    val_hooks_to_dict,
+)
+from pytorch_adapt.utils import common_functions as c_f
+
+from .constants import LOSSES_FILENAME
+from .logger import truncate_losses
+
+LAST_CHECKPOINT_PREFIX = "last_"
+
+
+# The best checkpoint is only saved when the score improves,
+# so this also saves the latest state every time validation runs.
+class ResumableCheckpointFnCreator(CheckpointFnCreator):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.last = ModelCheckpoint(
+            **{**self.kwargs, "filename_prefix": LAST_CHECKPOINT_PREFIX, "n_saved": 1}
+        )
+        self.resuming = False
+
+    def __call__(self, adapter=None, validator=None, val_hooks=None, **kwargs):
+        fn = super().__call__(adapter, validator, val_hooks, **kwargs)
+        if self.resuming:
+            self.restore_saved_checkpoints()
+        dict_to_save = {}
+        if adapter:
+            dict_to_save.update(adapter_to_dict(adapter))
+        if validator:
+            dict_to_save["validator"] = validator
+        if val_hooks:
+            dict_to_save.update(val_hooks_to_dict(val_hooks))
+
+        def last_fn(engine):
+            fn(engine)
+            self.last(engine, {"engine": engine, **dict_to_save})
+            self.delete_stale_files()
+
+        return last_fn
+
+    # So that the best checkpoint saved before the interruption
+    # is still compared against and deleted when it's beaten.
+    def restore_saved_checkpoints(self):
+        files = self.glob("*checkpointer*.pt")
+        if len(files) > 0:
+            self.ckpter.load_objects({"checkpointer": self.objs}, files[0])
+
+    # Files saved before the interruption aren't tracked by the new handlers
+    def delete_stale_files(self):
+        self.delete_files_except(self.files_to_keep())
+
+    def files_to_keep(self):
+        return {
+            str(x)
+            for x in [self.last.last_checkpoint, self.ckpter.last_checkpoint]
+            if x
+        }
+
+    def delete_files_except(self, keep):
+        for pattern in [f"{LAST_CHECKPOINT_PREFIX}*.pt", "*checkpointer*.pt"]:
+            for f in self.glob(pattern):
+                if f not in keep:
+                    os.remove(f)
+
+    def glob(self, pattern):
+        return glob.glob(os.path.join(self.ckpter.save_handler.dirname, pattern))
+
+
+def checkpoint_epoch(filepath):
+    return int(Path(filepath).stem.split("_")[-1])
+
+
+def get_last_checkpoint(exp_path):
+    files = glob.glob(
+        os.path.join(exp_path, "checkpoints", f"{LAST_CHECKPOINT_PREFIX}*.pt")
+    )
+    if len(files) == 0:
+        return None
+    return max(files, key=checkpoint_epoch)
+
+
+def delete_last_checkpoints(exp_path):
+    for f in glob.glob(
+        os.path.join(exp_path, "checkpoints", f"{LAST_CHECKPOINT_PREFIX}*.pt")
+    ):
+        os.remove(f)
+
+
+# Also truncates the loss series.
+# Returns False if the features file can't be read,
+# in which case the trial should be restarted.
+def truncate_features(exp_path, epoch):
+    truncate_losses(os.path.join(exp_path, "logs", LOSSES_FILENAME), epoch)
+    features_file = os.path.join(exp_path, "features", "features.hdf5")
+    if not os.path.isfile(features_file):
+        return True
+    try:
+        with h5py.File(features_file, "a") as hf:
+            for k in list(hf.keys()):
+                if int(k) > epoch:
+                    c_f.LOGGER.info(f"deleting epoch {k} from {features_file}")
+                    del hf[k]
+    except OSError as e:
+        c_f.LOGGER.warning(f"could not truncate {features_file}: {e}")
+        return False
+    return True
+
+
+def resume_trial(framework, checkpoint_fn, checkpoint_file):
+    adapter = framework.adapter
+    to_load = {
+        "engine": framework.trainer,
+        "validator": framework.validator,
+        **adapter_to_dict(adapter),
+        **val_hooks_to_dict(framework.val_hooks),
+    }
+    # lr schedulers are created in before_training_starts,
+    # so they're loaded once the trainer has started
+    to_load.pop("lr_schedulers")
+    checkpoint_fn.load_objects(to_load, checkpoint=checkpoint_file)
+    ignite_utils.resume_checks(framework.trainer, framework.validator)
+    checkpoint_fn.resuming = True
+
+    def load_lr_schedulers(engine):
+        state = torch.load(checkpoint_file, map_location=framework.device)
+        # reload optimizers because creating the schedulers resets their lr
+        adapter.optimizers.load_state_dict(state["optimizers"])
+        adapter.lr_schedulers.load_state_dict(state["lr_schedulers"])
+
+    framework.trainer.add_event_handler(Events.STARTED, load_lr_schedulers)
+    c_f.LOGGER.info(
+        f"resuming from epoch {framework.trainer.state.epoch} using {checkpoint_file}"
+    )
+
+
+# The interrupted trial was never added to the saved study,
+# so it will have the next trial number. Enqueue its params so that it's resumed.
+def enqueue_interrupted_trial(study, exp_path):
+    trial_path = os.path.join(exp_path, str(len(study.trials)))
+    config_file = os.path.join(trial_path, "configs", "args_and_trial_params.json")
+    if get_last_checkpoint(trial_path) is None or not os.path.isfile(config_file):
+        return
+    with open(config_file, "r") as f:
+        params = json.load(f)["trial_params"]
+    print(f"enqueuing interrupted trial {trial_path}")
+    study.enqueue_trial(params)
@@ -4,6 +4,8 @@ import h5py
 import numpy as np
 from pytorch_adapt.utils import common_functions as c_f
 
+from .logger import to_nested_dict
+
 
 class SaveFeatures:
     def __init__(self, folder, logger):
@@ -27,9 +29,11 @@ class SaveFeatures:
                 if name not in discard_keys()
             }
 
-        losses_dict = self.logger.get_losses()
-
         with h5py.File(os.path.join(self.folder, "features.hdf5"), "a") as hf:
+            # the losses of every iteration since the previously saved epoch
+            prev_epochs = [int(k) for k in hf.keys() if int(k) < epoch]
+            min_epoch = max(prev_epochs) + 1 if len(prev_epochs) > 0 else None
+            losses_dict = to_nested_dict(self.logger.get_losses(min_epoch, epoch))
             write_nested_dict(hf, inference_dict, epoch, "inference")
             write_nested_dict(hf, losses_dict, epoch, "losses")
 
@@ -0,0 +1,157 @@
+import fcntl
+import os
+
+import numpy as np
+import torch
+import torchvision.transforms as T
+from PIL import Image
+from pytorch_adapt.datasets import DomainNet126, Office31, OfficeHome
+from pytorch_adapt.utils import common_functions as c_f
+from tqdm import tqdm
+
+CACHEABLE = (Office31, OfficeHome, DomainNet126)
+
+
+# Decodes and resizes each image exactly like the first transform (T.Resize) would.
+class DecodeAndResize(torch.utils.data.Dataset):
+    def __init__(self, img_paths, resize):
+        self.img_paths = img_paths
+        self.resize = resize
+
+    def __len__(self):
+        return len(self.img_paths)
+
+    def __getitem__(self, idx):
+        img = Image.open(self.img_paths[idx]).convert("RGB")
+        return np.asarray(self.resize(img), dtype=np.uint8)
+
+
+def cache_filenames(folder, dataset, resolution):
+    split = "train" if dataset.train else "test"
+    name = f"{type(dataset).__name__.lower()}_{dataset.domain}_{split}_{resolution}"
+    return (
+        os.path.join(folder, f"{name}_images.bin"),
+        os.path.join(folder, f"{name}_index.npy"),
+    )
+
+
+# Images have different sizes after resizing the shorter side,
+# so they're written one after another to a flat uint8 file,
+# and the index has the (offset, height, width) of each image.
+# The index is written last, so its existence means the cache is complete.
+def build_cache(dataset, resize, images_file, index_file, num_workers):
+    dataloader = torch.utils.data.DataLoader(
+        DecodeAndResize(dataset.img_paths, resize),
+        batch_size=None,
+        num_workers=num_workers,
+    )
+    index = np.zeros((len(dataset), 3), dtype=np.int64)
+    offset = 0
+    with open(f"{images_file}.tmp", "wb") as f:
+        for i, img in enumerate(tqdm(dataloader, desc=f"caching {images_file}")):
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            index[i] = [offset, img.shape[0], img.shape[1]]
+            offset += img.size
+            f.write(img.tobytes())
+    os.replace(f"{images_file}.tmp", images_file)
+    with open(f"{index_file}.tmp", "wb") as f:
+        np.save(f, index)
+    os.replace(f"{index_file}.tmp", index_file)
+
+
+def cache_is_complete(index_file, dataset):
+    if not os.path.isfile(index_file):
+        return False
+    return len(np.load(index_file, mmap_mode="r")) == len(dataset)
+
+
+def get_cache_files(folder, dataset, resize, num_workers):
+    images_file, index_file = cache_filenames(folder, dataset, resize.size)
+    # only one process on the machine builds each cache file
+    with open(os.path.join(folder, "image_cache.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if not cache_is_complete(index_file, dataset):
+                build_cache(dataset, resize, images_file, index_file, num_workers)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return images_file, index_file
+
+
+# Reads resized images from the cache, and applies the rest of the transform,
+# i.e. the random crops and flips.
+class CachedImageDataset(torch.utils.data.Dataset):
+    def __init__(self, dataset, images_file, index_file, transform):
+        self.dataset = dataset
+        self.domain = dataset.domain
+        self.labels = dataset.labels
+        self.img_paths = dataset.img_paths
+        self.images_file = images_file
+        self.index = np.load(index_file)
+        self.transform = transform
+        self.images = None
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        # opened lazily so that each dataloader worker has its own memmap
+        if self.images is None:
+            self.images = np.memmap(self.images_file, dtype=np.uint8, mode="r")
+        offset, height, width = self.index[idx]
+        img = self.images[offset : offset + height * width * 3]
+        img = Image.fromarray(np.array(img).reshape(height, width, 3))
+        if self.transform is not None:
+            img = self.transform(img)
+        return img, self.labels[idx]
+
+    def __getstate__(self):
+        return {**self.__dict__, "images": None}
+
+    def __repr__(self):
+        extra_repr = f"domain={self.domain}\nlen={str(self.__len__())}"
+        return c_f.nice_repr(self, extra_repr, {"transform": self.transform})
+
+
+def split_transform(transform):
+    if not isinstance(transform, T.Compose) or len(transform.transforms) == 0:
+        return None, None
+    resize = transform.transforms[0]
+    if not isinstance(resize, T.Resize) or not isinstance(resize.size, int):
+        return None, None
+    return resize, T.Compose(transform.transforms[1:])
+
+
+def use_cache(dataset, folder, num_workers):
+    resize, rest = split_transform(dataset.transform)
+    if resize is None:
+        name = f"{type(dataset).__name__} {dataset.domain}"
+        c_f.LOGGER.info(
+            f"not caching {name}, its transform doesn't start with T.Resize"
+        )
+        return dataset
+    images_file, index_file = get_cache_files(folder, dataset, resize, num_workers)
+    return CachedImageDataset(dataset, images_file, index_file, rest)
+
+
+# Replaces every Office31/OfficeHome/DomainNet126 dataset nested inside
+# the SourceDataset/TargetDataset/ConcatDataset wrappers.
+def replace_with_cached(dataset, folder, num_workers):
+    if isinstance(dataset, CACHEABLE):
+        return use_cache(dataset, folder, num_workers)
+    if isinstance(dataset, torch.utils.data.ConcatDataset):
+        dataset.datasets = [
+            replace_with_cached(d, folder, num_workers) for d in dataset.datasets
+        ]
+    for k in ["dataset", "source_dataset", "target_dataset"]:
+        if hasattr(dataset, k):
+            new_dataset = replace_with_cached(getattr(dataset, k), folder, num_workers)
+            setattr(dataset, k, new_dataset)
+    return dataset
+
+
+def add_image_cache(datasets, folder, num_workers=0):
+    c_f.makedir_if_not_there(folder)
+    return {
+        k: replace_with_cached(v, folder, num_workers) for k, v in datasets.items()
+    }
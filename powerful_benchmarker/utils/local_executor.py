@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import signal
+import time
+
+import submitit
+
+LOCAL_RANK_ENV = "LOCAL_EXECUTOR_RANK"
+LOCAL_JOBID_PREFIX = "local"
+
+
+def add_executor_args(parser):
+    parser.add_argument(
+        "--executor", type=str, choices=["slurm", "local"], default="slurm"
+    )
+    parser.add_argument("--num_slots", type=int, default=1)
+    parser.add_argument("--cpus_per_slot", type=int, default=None)
+
+
+def get_executor(args, folder):
+    if args.executor == "local":
+        return LocalExecutor(folder, args.num_slots, args.cpus_per_slot)
+    return submitit.AutoExecutor(folder=folder)
+
+
+def get_local_rank():
+    if LOCAL_RANK_ENV in os.environ:
+        return int(os.environ[LOCAL_RANK_ENV])
+    return submitit.JobEnvironment().local_rank
+
+
+def is_local_jobid(jobid):
+    return str(jobid).startswith(f"{LOCAL_JOBID_PREFIX}_")
+
+
+# In clock ticks since boot. None if there's no process with this pid.
+def process_start_time(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command name can contain spaces, so split after it
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+
+def task_id(pid):
+    return f"{pid}-{process_start_time(pid)}"
+
+
+# Each task is recorded as "{pid}-{start_time}",
+# so that a pid that was reused by another process can be detected.
+def local_jobid_to_tasks(jobid):
+    tasks = []
+    for x in jobid.split("_")[1:]:
+        pid, start_time = x.split("-") if "-" in x else (x, None)
+        tasks.append((int(pid), start_time))
+    return tasks
+
+
+def is_same_process(pid, start_time):
+    return start_time is not None and str(process_start_time(pid)) == start_time
+
+
+def kill_local_job(jobid):
+    for pid, start_time in local_jobid_to_tasks(jobid):
+        curr_start_time = process_start_time(pid)
+        # If the pid doesn't exist, other processes in the task's group might.
+        # A pid can't be reused while it's the id of an existing process group.
+        if curr_start_time is not None and not is_same_process(pid, start_time):
+            print(f"not killing {pid}, it isn't the process that was started")
+            continue
+        try:
+            # each task is the leader of its own process group
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def local_job_is_running(jobid):
+    return any(is_same_process(*x) for x in local_jobid_to_tasks(jobid))
+
+
+def split_cpus(num_slots, cpus_per_slot):
+    cpus = sorted(os.sched_getaffinity(0))
+    if cpus_per_slot is None:
+        cpus_per_slot = max(1, len(cpus) // num_slots)
+    if cpus_per_slot * num_slots > len(cpus):
+        raise ValueError(
+            f"{num_slots} slots x {cpus_per_slot} cpus is more than the {len(cpus)} available cpus"
+        )
+    return [cpus[i * cpus_per_slot : (i + 1) * cpus_per_slot] for i in range(num_slots)]
+
+
+def run_task(fn, args, local_rank, cpus, log_path):
+    os.setsid()
+    os.sched_setaffinity(0, cpus)
+    os.environ[LOCAL_RANK_ENV] = str(local_rank)
+    os.environ["OMP_NUM_THREADS"] = str(len(cpus))
+    with open(log_path, "w") as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        fn(*args)
+
+
+class LocalJob:
+    def __init__(self, processes):
+        self.processes = processes
+        self.job_id = "_".join(
+            [LOCAL_JOBID_PREFIX, *[task_id(p.pid) for p in self.processes]]
+        )
+
+    def done(self):
+        return not any(p.is_alive() for p in self.processes)
+
+    def wait(self):
+        for p in self.processes:
+            p.join()
+
+
+# Runs jobs on the current machine with the same interface as submitit.AutoExecutor.
+# Each task occupies one slot, and each slot is pinned to its own set of cpus.
+# submit() blocks until there are enough free slots for the task(s).
+class LocalExecutor:
+    def __init__(self, folder, num_slots=1, cpus_per_slot=None, poll_interval=5):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+        self.slots = split_cpus(num_slots, cpus_per_slot)
+        self.poll_interval = poll_interval
+        self.tasks_per_node = 1
+        self.num_submitted = 0
+        self.running = {}
+        self.ctx = multiprocessing.get_context("fork")
+
+    # slurm-specific parameters are ignored
+    def update_parameters(self, tasks_per_node=1, **kwargs):
+        self.tasks_per_node = tasks_per_node
+
+    def free_slot(self):
+        for i, p in list(self.running.items()):
+            if not p.is_alive():
+                p.join()
+                del self.running[i]
+        for i in range(len(self.slots)):
+            if i not in self.running:
+                return i
+        return None
+
+    def wait_for_free_slot(self):
+        while True:
+            i = self.free_slot()
+            if i is not None:
+                return i
+            time.sleep(self.poll_interval)
+
+    def submit(self, fn, *args):
+        processes = []
+        log_prefix = f"{os.getpid()}_{self.num_submitted}"
+        self.num_submitted += 1
+        for local_rank in range(self.tasks_per_node):
+            i = self.wait_for_free_slot()
+            log_path = os.path.join(self.folder, f"{log_prefix}_{local_rank}_log.out")
+            p = self.ctx.Process(
+                target=run_task,
+                args=(fn, args, local_rank, self.slots[i], log_path),
+            )
+            p.start()
+            print(f"started local task {local_rank} on cpus {self.slots[i]}")
+            self.running[i] = p
+            processes.append(p)
+        return LocalJob(processes)
+
+    def wait(self):
+        for p in self.running.values():
+            p.join()
+        self.running.clear()
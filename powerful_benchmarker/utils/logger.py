@@ -1,3 +1,8 @@
+import bisect
+import os
+
+import h5py
+import numpy as np
 from pytorch_adapt.frameworks.ignite import IgniteValHookWrapper
 from pytorch_adapt.frameworks.ignite.loggers import (
     BasicLossLogger,
@@ -5,12 +10,120 @@ from pytorch_adapt.frameworks.ignite.loggers import (
 )
 from pytorch_adapt.utils import common_functions as c_f
 
+from .constants import LOSSES_FILENAME
+
+INDEX_KEYS = ["iteration", "epoch"]
+
+
+def get_series_names(hf):
+    names = []
+
+    def fn(k, v):
+        if isinstance(v, h5py.Dataset):
+            names.append(k)
+
+    hf.visititems(fn)
+    return names
+
+
+# Every logged iteration is a row, and each loss is a 1D dataset
+# named "{group}/{loss}", aligned with the "iteration" and "epoch" datasets.
+# Rows are kept in memory until there are chunk_size of them,
+# and then appended to the file. Losses that are missing in a row are nan.
+class LossSeries:
+    def __init__(self, filepath, chunk_size=1000):
+        self.filepath = filepath
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.latest = {}
+
+    def append(self, losses, iteration, epoch):
+        row = {"iteration": iteration, "epoch": epoch}
+        self.latest = {}
+        for group, x in losses.items():
+            for k, v in x.items():
+                if len(v) > 0:
+                    row[f"{group}/{k}"] = v[-1]
+                    self.latest[f"{group}_{k}"] = v[-1]
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        c_f.makedir_if_not_there(os.path.dirname(self.filepath))
+        with h5py.File(self.filepath, "a") as hf:
+            start = len(hf["iteration"]) if "iteration" in hf else 0
+            end = start + len(self.rows)
+            new_names = dict.fromkeys(k for row in self.rows for k in row)
+            for k in new_names:
+                if k not in hf:
+                    is_index = k in INDEX_KEYS
+                    hf.create_dataset(
+                        k,
+                        shape=(start,),
+                        maxshape=(None,),
+                        chunks=(self.chunk_size,),
+                        dtype=np.int64 if is_index else np.float32,
+                        fillvalue=-1 if is_index else np.nan,
+                        compression="gzip",
+                    )
+            # series that aren't in these rows are filled with nan
+            for k in get_series_names(hf):
+                hf[k].resize((end,))
+            for k in new_names:
+                hf[k][start:end] = [row.get(k, np.nan) for row in self.rows]
+        self.rows = []
+
+
+# Returns {"iteration": array, "epoch": array, "{group}/{loss}": array, ...}
+# for the iterations in the epoch range [min_epoch, max_epoch].
+# The epoch dataset is sorted, so the range is found with a binary search
+# on the file, and only those rows are read.
+def read_losses(filepath, min_epoch=None, max_epoch=None):
+    if not os.path.isfile(filepath):
+        return {}
+    with h5py.File(filepath, "r") as hf:
+        epochs = hf["epoch"]
+        start, end = 0, len(epochs)
+        if min_epoch is not None:
+            start = bisect.bisect_left(epochs, min_epoch)
+        if max_epoch is not None:
+            end = bisect.bisect_right(epochs, max_epoch)
+        return {k: hf[k][start:end] for k in get_series_names(hf)}
+
+
+# Converts the output of read_losses to {group: {loss: array}},
+# which is the format of BasicLossLogger.get_losses.
+def to_nested_dict(losses):
+    output = {}
+    for k, v in losses.items():
+        if k in INDEX_KEYS or len(v) == 0:
+            continue
+        group, name = k.split("/", 1)
+        output.setdefault(group, {})[name] = v[~np.isnan(v)]
+    return output
+
+
+# Removes the rows after "epoch", when resuming a trial.
+def truncate_losses(filepath, epoch):
+    if not os.path.isfile(filepath):
+        return
+    with h5py.File(filepath, "a") as hf:
+        end = bisect.bisect_right(hf["epoch"], epoch)
+        for k in get_series_names(hf):
+            hf[k].resize((end,))
+
 
 class Logger:
-    def __init__(self, folder, record_keeper_freq=50):
+    def __init__(self, folder, record_keeper_freq=50, loss_chunk_size=1000):
         self.logger1 = BasicLossLogger()
         self.logger2 = IgniteRecordKeeperLogger(folder=folder)
         self.record_keeper_freq = record_keeper_freq
+        self.losses = LossSeries(
+            os.path.join(folder, LOSSES_FILENAME), loss_chunk_size
+        )
 
     def add_training(self, adapter):
         fn1 = self.logger1.add_training(adapter)
@@ -18,6 +131,10 @@ class Logger:
 
         def fn(engine):
             fn1(engine)
+            # logger1 only holds the losses of the current iteration
+            self.losses.append(
+                self.logger1.get_losses(), engine.state.iteration, engine.state.epoch
+            )
             if engine.state.iteration % self.record_keeper_freq == 0:
                 fn2(engine)
 
@@ -26,11 +143,21 @@ class Logger:
     def add_validation(self, *args, **kwargs):
         self.logger2.add_validation(*args, **kwargs)
 
+    # called after every validation, so the losses on disk are up to date
+    # when a checkpoint is saved
     def write(self, *args, **kwargs):
+        self.losses.flush()
         self.logger2.write(*args, **kwargs)
 
-    def get_losses(self):
-        return self.logger1.get_losses()
+    def flush(self):
+        self.losses.flush()
+
+    def get_losses(self, min_epoch=None, max_epoch=None):
+        self.losses.flush()
+        return read_losses(self.losses.filepath, min_epoch, max_epoch)
+
+    def latest_losses(self):
+        return self.losses.latest
 
 
 class IgniteValHookWrapperWithPrint(IgniteValHookWrapper):
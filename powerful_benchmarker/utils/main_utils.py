@@ -1,11 +1,17 @@
+import fcntl
 import glob
 import json
+import multiprocessing
 import os
 import shutil
+from contextlib import contextmanager
 from pathlib import Path
 
 import joblib
+import numpy as np
 import optuna
+import torch
+from optuna.distributions import distribution_to_json, json_to_distribution
 from optuna.trial import TrialState
 from pytorch_adapt.datasets import DataloaderCreator
 from pytorch_adapt.datasets.getters import (
@@ -16,13 +22,22 @@ from pytorch_adapt.datasets.getters import (
     get_voc_multilabel,
 )
 from pytorch_adapt.frameworks.ignite import IgniteMultiLabelClassification
+from pytorch_adapt.frameworks.ignite import utils as ignite_utils
 from pytorch_adapt.transforms.classification import get_timm_transform
 from pytorch_adapt.utils import common_functions as c_f
 from pytorch_adapt.validators import MultipleValidators, ScoreHistories
+from pytorch_adapt.validators import utils as val_utils
 
 from . import get_validator
+from .batch_augmentation import BatchAugmentation, get_uint8_transform
+from .constants import TRIALS_JOURNAL_FILENAME
+from .dedup_inference import same_samples
+from .image_cache import add_image_cache
 from .logger import IgniteValHookWrapperWithPrint
 
+STUDY_NAME = "study"
+STUDY_JOURNAL_FILENAME = "study_journal.log"
+
 
 def save_this_file(file_in, folder):
     if folder is not None:
@@ -62,22 +77,34 @@ def num_repro_complete(exp_path, return_filepath=False):
     return x
 
 
-def get_dataloader_creator(batch_size, num_workers):
+# multiprocessing_context="spawn" is needed when the dataloaders are iterated
+# in a process that is running other threads, where forking workers can deadlock.
+def get_dataloader_creator(
+    batch_size, num_workers, batch_augmentation=False, multiprocessing_context=None
+):
+    train_kwargs = {
+        "batch_size": batch_size,
+        "num_workers": num_workers,
+        "shuffle": True,
+        "drop_last": True,
+        "pin_memory": True,
+    }
+    val_kwargs = {
+        "batch_size": batch_size,
+        "num_workers": num_workers,
+        "shuffle": False,
+        "drop_last": False,
+        "pin_memory": True,
+    }
+    if batch_augmentation:
+        train_kwargs["collate_fn"] = BatchAugmentation()
+    # DataLoader only accepts a context if it has workers
+    if multiprocessing_context is not None and num_workers > 0:
+        train_kwargs["multiprocessing_context"] = multiprocessing_context
+        val_kwargs["multiprocessing_context"] = multiprocessing_context
     return DataloaderCreator(
-        train_kwargs={
-            "batch_size": batch_size,
-            "num_workers": num_workers,
-            "shuffle": True,
-            "drop_last": True,
-            "pin_memory": True,
-        },
-        val_kwargs={
-            "batch_size": batch_size,
-            "num_workers": num_workers,
-            "shuffle": False,
-            "drop_last": False,
-            "pin_memory": True,
-        },
+        train_kwargs=train_kwargs,
+        val_kwargs=val_kwargs,
         val_names=[
             "src_train",
             "src_val",
@@ -137,6 +164,7 @@ def get_val_hooks(
     use_stat_getter,
     save_features,
     save_features_cls,
+    online_validators=None,
 ):
     hooks = []
     if use_stat_getter:
@@ -144,6 +172,11 @@ def get_val_hooks(
         hooks.append(IgniteValHookWrapperWithPrint(stat_getter, logger=logger))
     if save_features:
         hooks.append(save_features_cls(folder, logger))
+    if online_validators:
+        # imported here so that training doesn't import validator_tests otherwise
+        from .online_validators import OnlineValidators
+
+        hooks.append(OnlineValidators(folder, online_validators))
     return hooks
 
 
@@ -155,6 +188,9 @@ def get_datasets(
     folder,
     download,
     evaluate,
+    image_cache_folder=None,
+    num_workers=0,
+    batch_augmentation=False,
 ):
     if not evaluate and pretrain_on_src and len(target_domains) > 0:
         raise ValueError("target_domain must be [] if pretrain_on_src is True")
@@ -174,6 +210,8 @@ def get_datasets(
     transform_getter = None
     if dataset == "domainnet126" and pretrain_on_src:
         transform_getter = get_timm_transform
+    elif batch_augmentation:
+        transform_getter = get_uint8_transform
 
     datasets = getter(
         src_domains,
@@ -183,35 +221,302 @@ def get_datasets(
         download=download,
         transform_getter=transform_getter,
     )
+    if image_cache_folder:
+        datasets = add_image_cache(datasets, image_cache_folder, num_workers)
     c_f.LOGGER.info(datasets)
     return datasets
 
 
+# The same indices are used for every trial and epoch,
+# and splits of the same length (like target_train and target_train_with_labels)
+# get the same indices. The original indices are saved as "sample_idx"
+# in the features file.
+def subsample_val_datasets(datasets, splits, size, seed=0):
+    if not size:
+        return datasets
+    datasets = {**datasets}
+    for k in splits:
+        if k not in datasets or len(datasets[k]) <= size:
+            continue
+        rng = np.random.default_rng(seed)
+        indices = np.sort(rng.choice(len(datasets[k]), size, replace=False))
+        c_f.LOGGER.info(f"using {size} of {len(datasets[k])} samples of {k}")
+        datasets[k] = torch.utils.data.Subset(datasets[k], indices.tolist())
+    return datasets
+
+
 def save_study(study_path):
+    exp_path = os.path.dirname(study_path)
+
     def return_func(study, frozen_trial):
-        joblib.dump(study, study_path)
+        joblib.dump(study, f"{study_path}.tmp")
+        os.replace(f"{study_path}.tmp", study_path)
+        truncate_trials_journal(study, exp_path)
 
     return return_func
 
 
-def plot_visualizations(plot_path):
+def frozen_trial_to_dict(trial):
+    return {
+        "number": trial.number,
+        "state": trial.state.name,
+        "value": trial.value,
+        "params": trial.params,
+        "distributions": {
+            k: distribution_to_json(v) for k, v in trial.distributions.items()
+        },
+        "user_attrs": trial.user_attrs,
+        "intermediate_values": trial.intermediate_values,
+        "datetime_start": str(trial.datetime_start),
+        "datetime_complete": str(trial.datetime_complete),
+    }
+
+
+def dict_to_frozen_trial(x):
+    return optuna.trial.create_trial(
+        state=TrialState[x["state"]],
+        value=x["value"] if x["state"] == "COMPLETE" else None,
+        params=x["params"],
+        distributions={
+            k: json_to_distribution(v) for k, v in x["distributions"].items()
+        },
+        user_attrs=x["user_attrs"],
+        intermediate_values={int(k): v for k, v in x["intermediate_values"].items()},
+    )
+
+
+# One line per finished trial, appended with a single write,
+# so the cost doesn't grow with the number of trials.
+def append_to_trials_journal(exp_path):
+    filepath = os.path.join(exp_path, TRIALS_JOURNAL_FILENAME)
+
     def return_func(study, frozen_trial):
+        line = f"{json.dumps(frozen_trial_to_dict(frozen_trial))}\n"
+        fd = os.open(filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
         try:
-            fig = optuna.visualization.plot_contour(study)
-            fig.write_html(os.path.join(plot_path, "contour_plot.html"))
-            fig = optuna.visualization.plot_parallel_coordinate(study)
-            fig.write_html(os.path.join(plot_path, "parallel_coordinate.html"))
-            fig = optuna.visualization.plot_param_importances(study)
-            fig.write_html(os.path.join(plot_path, "importances.html"))
-        except Exception:
-            pass
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    return return_func
+
+
+def read_trials_journal(exp_path):
+    filepath = os.path.join(exp_path, TRIALS_JOURNAL_FILENAME)
+    if not os.path.isfile(filepath):
+        return []
+    trials = []
+    with open(filepath, "r") as f:
+        for line in f:
+            try:
+                trials.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the last line is incomplete if the process was killed mid-write
+                break
+    return trials
+
+
+# Sets the journaled final state of a trial that was running
+# when study.pkl was written.
+def finish_trial(study, trial, x):
+    storage, trial_id = study._storage, trial._trial_id
+    for k, v in x["params"].items():
+        if k not in trial.params:
+            distribution = json_to_distribution(x["distributions"][k])
+            internal_value = distribution.to_internal_repr(v)
+            storage.set_trial_param(trial_id, k, internal_value, distribution)
+    for step, v in x["intermediate_values"].items():
+        storage.set_trial_intermediate_value(trial_id, int(step), v)
+    for k, v in x["user_attrs"].items():
+        storage.set_trial_user_attr(trial_id, k, v)
+    values = [x["value"]] if x["state"] == "COMPLETE" else None
+    storage.set_trial_state_values(trial_id, TrialState[x["state"]], values)
+
+
+# study.pkl is only written every few trials,
+# so add the trials that finished after it was last written,
+# and finish the ones that were still running when it was written.
+# Trials that were asked but are in neither file are added as failed,
+# so that trial numbers still match the trial folders.
+def replay_trials_journal(study, exp_path):
+    num_replayed = 0
+    for x in sorted(read_trials_journal(exp_path), key=lambda x: x["number"]):
+        trials = study.get_trials(deepcopy=False)
+        if x["number"] < len(trials):
+            if is_finished(trials[x["number"]]):
+                continue
+            finish_trial(study, trials[x["number"]], x)
+        else:
+            for _ in range(len(trials), x["number"]):
+                study.add_trial(optuna.trial.create_trial(state=TrialState.FAIL))
+            study.add_trial(dict_to_frozen_trial(x))
+        num_replayed += 1
+    if num_replayed > 0:
+        print(f"replayed {num_replayed} trials from {TRIALS_JOURNAL_FILENAME}")
+
+
+# After study.pkl is written, the journal only needs the trials
+# that aren't finished in it. This is called by the same process or lock
+# that appends to the journal.
+def truncate_trials_journal(study, exp_path):
+    filepath = os.path.join(exp_path, TRIALS_JOURNAL_FILENAME)
+    if not os.path.isfile(filepath):
+        return
+    finished = {t.number for t in study.get_trials(deepcopy=False) if is_finished(t)}
+    lines = [x for x in read_trials_journal(exp_path) if x["number"] not in finished]
+    with open(f"{filepath}.tmp", "w") as f:
+        for x in lines:
+            f.write(f"{json.dumps(x)}\n")
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+# Counts the trials that finished in this process,
+# because trial numbers are shared with other workers and include failed trials,
+# so they could skip every multiple of n.
+def every_n_trials(n, callbacks):
+    num_finished = 0
+
+    def return_func(study, frozen_trial):
+        nonlocal num_finished
+        num_finished += 1
+        if num_finished % n == 0:
+            for c in callbacks:
+                c(study, frozen_trial)
+
+    return return_func
+
+
+# Shared storage that lets multiple processes run trials of the same study
+def get_study_storage(exp_path):
+    return optuna.storages.JournalStorage(
+        optuna.storages.JournalFileStorage(
+            os.path.join(exp_path, STUDY_JOURNAL_FILENAME)
+        )
+    )
+
+
+# The pkl format that the rest of the code expects
+def in_memory_study_copy(storage):
+    in_memory_storage = optuna.storages.InMemoryStorage()
+    optuna.copy_study(
+        from_study_name=STUDY_NAME,
+        from_storage=storage,
+        to_storage=in_memory_storage,
+    )
+    return optuna.load_study(study_name=STUDY_NAME, storage=in_memory_storage)
+
+
+def save_study_copy(study_path, storage):
+    save_fn = save_study(study_path)
+
+    def return_func(study, frozen_trial):
+        save_fn(in_memory_study_copy(storage), frozen_trial)
+
+    return return_func
+
+
+@contextmanager
+def file_lock(lock_path):
+    with open(lock_path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def locked(exp_path, callbacks):
+    lock_path = os.path.join(exp_path, "callbacks.lock")
+
+    def return_func(study, frozen_trial):
+        with file_lock(lock_path):
+            for c in callbacks:
+                c(study, frozen_trial)
+
+    return return_func
+
+
+# Returns None if num_trials trials are already complete, pruned or running.
+# Counting and asking are done under a lock shared by the parallel workers,
+# otherwise they could all see num_trials - 1 trials and each start one.
+# If a running trial fails, its worker asks for another.
+def ask_within_budget(study, exp_path, num_trials):
+    states = (TrialState.COMPLETE, TrialState.PRUNED, TrialState.RUNNING)
+    with file_lock(os.path.join(exp_path, "ask.lock")):
+        if len(study.get_trials(deepcopy=False, states=states)) >= num_trials:
+            return None
+        return study.ask()
+
+
+def is_finished(trial):
+    return trial.state not in [TrialState.RUNNING, TrialState.WAITING]
+
+
+# The CUDA_VISIBLE_DEVICES of worker i.
+# Workers are spread over the gpus that this process can see,
+# so they stay within the parent's CUDA_VISIBLE_DEVICES if it is set.
+def get_worker_devices(i):
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        devices = [x.strip() for x in visible.split(",") if x.strip() != ""]
+    else:
+        devices = [str(j) for j in range(torch.cuda.device_count())]
+    if len(devices) == 0:
+        return None
+    return devices[i % len(devices)]
+
+
+def write_visualizations(study, plot_path):
+    try:
+        for name, plot_fn in [
+            ("contour_plot", optuna.visualization.plot_contour),
+            ("parallel_coordinate", optuna.visualization.plot_parallel_coordinate),
+            ("importances", optuna.visualization.plot_param_importances),
+        ]:
+            filepath = os.path.join(plot_path, f"{name}.html")
+            tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+            plot_fn(study).write_html(tmp_filepath)
+            os.replace(tmp_filepath, filepath)
+    except Exception:
+        pass
+
+
+# Plots every "interval" trials (never if interval is 0),
+# and always when called with frozen_trial=None at the end of the study.
+# In background mode, plotting happens in a forked process with a snapshot of the study,
+# and is skipped if the previous plotting process hasn't finished yet.
+def plot_visualizations(plot_path, interval=1, background=False):
+    process = None
+    ctx = multiprocessing.get_context("fork")
+
+    def return_func(study, frozen_trial):
+        nonlocal process
+        if frozen_trial is None:
+            if process is not None:
+                process.join()
+            write_visualizations(study, plot_path)
+            return
+        if interval <= 0 or (frozen_trial.number + 1) % interval != 0:
+            return
+        if not background:
+            write_visualizations(study, plot_path)
+            return
+        if process is not None:
+            if process.is_alive():
+                print("previous visualizations are still being written, skipping")
+                return
+            process.join()
+        process = ctx.Process(target=write_visualizations, args=(study, plot_path))
+        process.start()
 
     return return_func
 
 
 def save_dataframe(log_path):
     def return_func(study, frozen_trial):
-        study.trials_dataframe().to_csv(log_path, sep=",")
+        study.trials_dataframe().to_csv(f"{log_path}.tmp", sep=",")
+        os.replace(f"{log_path}.tmp", log_path)
 
     return return_func
 
@@ -225,11 +530,17 @@ def delete_suboptimal_models(exp_path):
             print("no best_trial yet")
             return
         keep = str(bt.number)
+        # other workers may still be training these
+        unfinished = {str(st.number) for st in study.trials if not is_finished(st)}
         all_paths = sorted(glob.glob(f"{exp_path}/*"))
         for x in all_paths:
             if os.path.isdir(x):
                 trial_name = os.path.basename(x)
-                if trial_name.isdigit() and trial_name != keep:
+                if (
+                    trial_name.isdigit()
+                    and trial_name != keep
+                    and trial_name not in unfinished
+                ):
                     model_folder = os.path.join(x, "checkpoints")
                     if os.path.isdir(model_folder):
                         print(f"deleting {model_folder}")
@@ -242,7 +553,7 @@ def delete_failed_features(exp_path):
     def return_func(study, frozen_trial):
         print("delete_failed_features")
         for st in study.trials:
-            if st.state == TrialState.COMPLETE:
+            if st.state == TrialState.COMPLETE or not is_finished(st):
                 continue
             features_folder = os.path.join(exp_path, str(st.number), "features")
             if os.path.isdir(features_folder):
@@ -253,14 +564,33 @@ def delete_failed_features(exp_path):
 
 
 # assumes oracle validator
-def evaluate(adapter, datasets, validator, dataloader_creator):
+# Loads the best checkpoint once, and scores it on every domain in
+# datasets_per_domain. Inference is only run once for splits with the same samples.
+def evaluate(framework, datasets_per_domain, validator, dataloader_creator):
+    c_f.LOGGER.info("***EVALUATING BEST MODEL***")
     dataloader_creator.all_val = True
+    framework.checkpoint_fn.load_best_checkpoint(
+        {"models": framework.adapter.models}
+    )
+    collected = []
     scores = {}
-    for split in ["target_train_with_labels", "target_val_with_labels"]:
-        validator.key_map = {split: "src_val"}
-        scores[split] = adapter.evaluate_best_model(
-            datasets, validator, dataloader_creator
-        )
+    for domain, datasets in datasets_per_domain.items():
+        scores[domain] = {}
+        for split in ["target_train_with_labels", "target_val_with_labels"]:
+            dataset = datasets[split]
+            outputs = next(
+                (v for k, v in collected if same_samples(k, dataset)), None
+            )
+            if outputs is None:
+                dataloaders = dataloader_creator(**{split: dataset})
+                outputs = ignite_utils.collect_from_dataloaders(
+                    framework.collector, dataloaders, [split]
+                )[split]
+                collected.append((dataset, outputs))
+            validator.key_map = {split: "src_val"}
+            scores[domain][split] = val_utils.call_val_hook(
+                validator, {split: outputs}
+            )
     return scores
 
 
@@ -276,6 +606,39 @@ def args_check(args):
             )
         if not args.multilabel:
             raise ValueError("--multilabel must be applied for multilabel datasets")
+    if args.pruner != "none" and args.validator is None:
+        raise ValueError("--pruner requires --validator")
+    if args.val_schedule != "fixed" and args.successive_halving_rungs > 1:
+        raise ValueError(
+            "--val_schedule must be 'fixed' when using --successive_halving_rungs"
+        )
+    if args.val_schedule == "list" and not args.val_epochs:
+        raise ValueError("--val_epochs must be specified if --val_schedule is 'list'")
+    if args.batch_augmentation:
+        if args.dataset not in ["office31", "officehome", "domainnet126"]:
+            raise ValueError(
+                "--batch_augmentation only works with office31, officehome and domainnet126"
+            )
+        if args.dataset == "domainnet126" and args.pretrain_on_src:
+            raise ValueError(
+                "--batch_augmentation can't be used when pretraining on domainnet126"
+            )
+    if args.successive_halving_rungs > 1:
+        if args.validator is None:
+            raise ValueError("--successive_halving_rungs requires --validator")
+        if args.pruner != "none" or args.num_parallel_trials > 1:
+            raise ValueError(
+                "--successive_halving_rungs can't be used with --pruner or --num_parallel_trials"
+            )
+    if args.trials_per_process > 1:
+        if args.num_parallel_trials > 1 or args.successive_halving_rungs > 1:
+            raise ValueError(
+                "--trials_per_process can't be used with --num_parallel_trials or --successive_halving_rungs"
+            )
+        if args.resume_trials:
+            raise ValueError("--trials_per_process can't be used with --resume_trials")
+    if "train" in args.val_subsample_splits:
+        raise ValueError("--val_subsample_splits can't include the 'train' split")
 
 
 def framework_check(adapter_name, framework):
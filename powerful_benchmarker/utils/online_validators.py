@@ -0,0 +1,106 @@
+import os
+import pickle
+
+import pandas as pd
+from pytorch_adapt.utils import common_functions as c_f
+
+from validator_tests import configs
+from validator_tests import flags as flags_module
+from validator_tests.utils import utils as vt_utils
+from validator_tests.utils.score_utils import get_and_save_scores
+
+
+# Scores validator_tests validators on the collected data during training,
+# and saves the same dataframes as validator_tests/main.py,
+# so validator_tests/main.py will skip these validators for this trial.
+# "flags" are names of functions in validator_tests/flags.
+# During training, each epoch's rows are appended to <df_filepath>.partial,
+# and the dataframe is only saved when the trial finishes (save_final_scores).
+# So if the trial crashes, validator_tests/main.py doesn't mistake it for done.
+class OnlineValidators:
+    def __init__(self, folder, flags, skip_validator_errors=True):
+        self.folder = folder
+        self.required_data = [
+            "src_train",
+            "src_val",
+            "target_train_with_labels",
+            "target_val_with_labels",
+        ]
+        self.validators = []
+        for flag_name in flags:
+            for flag in getattr(flags_module, flag_name)():
+                validator_args = {k: v for k, v in flag.items() if k != "validator"}
+                validator = getattr(configs, flag["validator"])(validator_args)
+                args_str = vt_utils.dict_to_str(validator.validator_args)
+                rows = []
+                fn = get_and_save_scores(
+                    flag["validator"],
+                    validator,
+                    args_str,
+                    rows,
+                    skip_validator_errors,
+                    {"dataset": None, "seconds": []},
+                )
+                self.validators.append((flag["validator"], args_str, fn, rows))
+        self.exp_config = None
+        # rows from a previous run of a resumed trial may have to be dropped
+        self.rewrite_partial = True
+        self.load_existing_rows()
+
+    def __call__(self, epoch, **collected_data):
+        # same keys as in the features file
+        x = {}
+        for k, v in collected_data.items():
+            split = k.replace("_with_labels", "")
+            for name in v.keys():
+                x[f"inference/{split}/{name}"] = v[name].cpu().numpy()
+        if self.exp_config is None:
+            self.exp_config = vt_utils.read_exp_config_file(self.folder)
+        epoch = str(epoch)
+        for validator_name, args_str, fn, rows in self.validators:
+            # rows from a previous run of a resumed trial are replaced
+            rows[:] = [r for r in rows if int(r["epoch"]) < int(epoch)]
+            num_existing = len(rows)
+            fn(epoch, x, self.exp_config, self.folder)
+            filepath = self.partial_filepath(validator_name, args_str)
+            if self.rewrite_partial:
+                tmp_filepath = f"{filepath}.tmp"
+                with open(tmp_filepath, "wb") as f:
+                    pickle.dump(rows, f)
+                os.replace(tmp_filepath, filepath)
+            else:
+                with open(filepath, "ab") as f:
+                    pickle.dump(rows[num_existing:], f)
+        self.rewrite_partial = False
+        c_f.LOGGER.info(f"scored {len(self.validators)} online validators")
+
+    def partial_filepath(self, validator_name, args_str):
+        filepath = vt_utils.get_df_filepath(self.folder, validator_name, args_str)
+        return f"{filepath}.partial"
+
+    # when resuming a trial
+    def load_existing_rows(self):
+        for validator_name, args_str, _, rows in self.validators:
+            filepath = self.partial_filepath(validator_name, args_str)
+            if not os.path.isfile(filepath):
+                continue
+            with open(filepath, "rb") as f:
+                while True:
+                    try:
+                        rows.extend(pickle.load(f))
+                    except EOFError:
+                        break
+                    # the last append may be incomplete if the trial crashed
+                    except Exception:
+                        break
+
+    # Called when the trial is done training.
+    def save_final_scores(self):
+        for validator_name, args_str, _, rows in self.validators:
+            filepath = vt_utils.get_df_filepath(self.folder, validator_name, args_str)
+            tmp_filepath = f"{filepath}.tmp"
+            pd.DataFrame(rows).to_pickle(tmp_filepath)
+            os.replace(tmp_filepath, filepath)
+            partial_filepath = self.partial_filepath(validator_name, args_str)
+            if os.path.isfile(partial_filepath):
+                os.remove(partial_filepath)
@@ -0,0 +1,198 @@
+import json
+import os
+import resource
+import time
+
+import torch
+from ignite.engine import Events
+from pytorch_adapt.utils import common_functions as c_f
+
+from .constants import PERF_FILENAME
+
+PHASES = [
+    "train",
+    "data_wait",
+    "compute",
+    "val_inference",
+    "val_hooks",
+    "checkpoint",
+]
+
+
+def count_images(batch):
+    if not isinstance(batch, dict):
+        return 0
+    return sum(len(v) for k, v in batch.items() if k.endswith("_imgs"))
+
+
+def images_per_second(x):
+    if x["train"] == 0:
+        return 0
+    return x["images"] / x["train"]
+
+
+# Times a val hook, and otherwise behaves like it,
+# so that it's still saved in checkpoints and its required_data is still used.
+class TimedValHook:
+    def __init__(self, hook, telemetry):
+        self.hook = hook
+        self.telemetry = telemetry
+
+    def __call__(self, *args, **kwargs):
+        start = time.time()
+        output = self.hook(*args, **kwargs)
+        self.telemetry.add("val_hooks", time.time() - start)
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["hook"], name)
+
+
+# Records the time spent in each phase of every epoch, the training throughput,
+# peak memory, and the size of the features file.
+# It's written to perf.json in the trial folder at the end of every epoch.
+# "checkpoint" is the rest of the end-of-epoch time after validation inference
+# and val hooks, which is mostly checkpointing, but also includes
+# computing the validator score and logging.
+# Peak memory is for the whole process, so it includes previous trials
+# that ran in the same process. When several trials run in the same process
+# at the same time (batched_search), it's meaningless per trial,
+# so process_peaks should be False.
+class PerfTelemetry:
+    def __init__(self, folder, process_peaks=True):
+        self.folder = folder
+        self.process_peaks = process_peaks
+        self.filepath = os.path.join(folder, PERF_FILENAME)
+        self.features_file = os.path.join(folder, "features", "features.hdf5")
+        self.epochs = []
+        self.totals = {k: 0 for k in PHASES}
+        self.totals["images"] = 0
+        self.curr = None
+        self.start_time = None
+        self.epoch_start = None
+        self.train_end = None
+        self.previous_seconds = 0
+
+    def attach(self, framework):
+        trainer = framework.trainer
+        self.start_time = time.time()
+        if self.process_peaks and torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        timers = {}
+
+        def start_timer(name):
+            def fn(engine):
+                timers[name] = time.time()
+
+            return fn
+
+        def stop_timer(name, phase):
+            def fn(engine):
+                self.add(phase, time.time() - timers[name])
+
+            return fn
+
+        def count_batch(engine):
+            self.add("images", count_images(engine.state.batch))
+
+        trainer.add_event_handler(Events.EPOCH_STARTED, self.start_epoch)
+        trainer.add_event_handler(Events.GET_BATCH_STARTED, start_timer("get_batch"))
+        trainer.add_event_handler(
+            Events.GET_BATCH_COMPLETED, stop_timer("get_batch", "data_wait")
+        )
+        trainer.add_event_handler(Events.GET_BATCH_COMPLETED, count_batch)
+        trainer.add_event_handler(Events.ITERATION_STARTED, start_timer("iteration"))
+        trainer.add_event_handler(
+            Events.ITERATION_COMPLETED, stop_timer("iteration", "compute")
+        )
+        # the collector runs once per split during validation
+        framework.collector.add_event_handler(
+            Events.STARTED, start_timer("collector")
+        )
+        framework.collector.add_event_handler(
+            Events.COMPLETED, stop_timer("collector", "val_inference")
+        )
+        # This runs before the validation and checkpoint handlers
+        # that framework.run() adds, and end_epoch runs after them.
+        trainer.add_event_handler(Events.EPOCH_COMPLETED, self.end_training)
+
+        def add_end_epoch(engine):
+            trainer.add_event_handler(Events.EPOCH_COMPLETED, self.end_epoch)
+
+        trainer.add_event_handler(Events.STARTED, add_end_epoch)
+
+    def wrap_val_hooks(self, val_hooks):
+        return [TimedValHook(h, self) for h in val_hooks]
+
+    def add(self, name, value):
+        self.totals[name] += value
+        if self.curr is not None:
+            self.curr[name] += value
+
+    def start_epoch(self, engine):
+        self.curr = {k: 0 for k in PHASES}
+        self.curr["images"] = 0
+        self.epoch_start = time.time()
+
+    def end_training(self, engine):
+        self.train_end = time.time()
+        self.add("train", self.train_end - self.epoch_start)
+
+    def end_epoch(self, engine):
+        validation = self.curr["val_inference"] + self.curr["val_hooks"]
+        self.add("checkpoint", max(time.time() - self.train_end - validation, 0))
+        self.curr["epoch"] = engine.state.epoch
+        self.curr["elapsed_seconds"] = self.elapsed_seconds()
+        self.curr["images_per_second"] = images_per_second(self.curr)
+        self.curr["features_bytes"] = self.features_bytes()
+        self.epochs.append(self.curr)
+        self.curr = None
+        self.write()
+
+    def features_bytes(self):
+        if not os.path.isfile(self.features_file):
+            return 0
+        return os.path.getsize(self.features_file)
+
+    # Includes the time before the trial was resumed.
+    def elapsed_seconds(self):
+        return self.previous_seconds + time.time() - self.start_time
+
+    def summary(self):
+        x = {f"{k}_seconds": v for k, v in self.totals.items() if k in PHASES}
+        x["total_seconds"] = self.elapsed_seconds()
+        x["num_epochs"] = len(self.epochs)
+        x["images_per_second"] = images_per_second(self.totals)
+        if self.process_peaks:
+            # ru_maxrss is in kilobytes on linux
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            x["process_peak_rss_mb"] = rss
+            x["process_peak_gpu_mb"] = 0
+            if torch.cuda.is_available():
+                gpu = torch.cuda.max_memory_allocated() / 1024**2
+                x["process_peak_gpu_mb"] = gpu
+        x["features_bytes"] = self.features_bytes()
+        return x
+
+    # When resuming a trial, the epochs that were run after the checkpoint are dropped,
+    # along with the time spent running them.
+    def load(self, epoch):
+        if not os.path.isfile(self.filepath):
+            return
+        with open(self.filepath, "r") as f:
+            x = json.load(f)
+        self.epochs = [e for e in x["epochs"] if e["epoch"] <= epoch]
+        self.previous_seconds = 0
+        if len(self.epochs) > 0:
+            self.previous_seconds = self.epochs[-1]["elapsed_seconds"]
+        for e in self.epochs:
+            for k in self.totals.keys():
+                self.totals[k] += e[k]
+
+    def write(self):
+        c_f.makedir_if_not_there(self.folder)
+        x = {"summary": self.summary(), "epochs": self.epochs}
+        tmp_filepath = f"{self.filepath}.tmp"
+        with open(tmp_filepath, "w") as f:
+            json.dump(x, f, indent=2)
+        os.replace(tmp_filepath, self.filepath)
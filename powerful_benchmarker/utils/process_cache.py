@@ -0,0 +1,35 @@
+import copy
+import threading
+
+from pytorch_adapt.models import pretrained as pretrained_module
+
+# Objects that are the same for every trial in this process,
+# like the datasets and the pretrained models, are only created once.
+CACHE = {}
+LOCK = threading.Lock()
+
+
+def to_key(x):
+    if isinstance(x, dict):
+        return tuple(sorted((k, to_key(v)) for k, v in x.items()))
+    if isinstance(x, (list, tuple)):
+        return tuple(to_key(v) for v in x)
+    return x
+
+
+# Trials in other threads wait instead of creating the same object again.
+def get_or_create(key, fn):
+    key = to_key(key)
+    with LOCK:
+        if key not in CACHE:
+            CACHE[key] = fn()
+        return CACHE[key]
+
+
+# The cached model is never trained.
+# Each trial gets its own copy of it, with the original pretrained weights.
+def get_pretrained_model(name, **kwargs):
+    model = get_or_create(
+        ("pretrained", name, kwargs), lambda: getattr(pretrained_module, name)(**kwargs)
+    )
+    return copy.deepcopy(model)
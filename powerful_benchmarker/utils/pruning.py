@@ -0,0 +1,53 @@
+import optuna
+from ignite.engine import Events
+from pytorch_adapt.utils import common_functions as c_f
+
+PRUNERS = ["none", "median", "percentile", "successive_halving", "hyperband"]
+
+
+# each validation epoch is one step
+def get_pruner(cfg):
+    kwargs = {
+        "n_startup_trials": cfg.pruner_startup_trials,
+        "n_warmup_steps": cfg.pruner_warmup_epochs,
+        "interval_steps": cfg.val_interval,
+    }
+    if cfg.pruner == "median":
+        return optuna.pruners.MedianPruner(**kwargs)
+    if cfg.pruner == "percentile":
+        return optuna.pruners.PercentilePruner(cfg.pruner_percentile, **kwargs)
+    if cfg.pruner == "successive_halving":
+        return optuna.pruners.SuccessiveHalvingPruner(min_resource=cfg.val_interval)
+    if cfg.pruner == "hyperband":
+        return optuna.pruners.HyperbandPruner(
+            min_resource=cfg.val_interval, max_resource=cfg.max_epochs
+        )
+    return optuna.pruners.NopPruner()
+
+
+# Reports the validation score to optuna after every validation epoch,
+# and stops training if the pruner decides the trial should be pruned.
+# The objective then raises optuna.TrialPruned.
+class EpochPruner:
+    def __init__(self, trial, validator):
+        self.trial = trial
+        self.validator = validator
+        self.pruned = False
+
+    def attach(self, framework):
+        # framework.run() adds the validation handlers just before the trainer starts,
+        # so this is added at STARTED to run after them.
+        def add_handler(engine):
+            engine.add_event_handler(Events.EPOCH_COMPLETED, self.report)
+
+        framework.trainer.add_event_handler(Events.STARTED, add_handler)
+
+    def report(self, engine):
+        epoch = engine.state.epoch
+        if self.validator.latest_epoch != epoch:
+            return
+        self.trial.report(float(self.validator.latest_score), epoch)
+        if self.trial.should_prune():
+            c_f.LOGGER.info(f"pruning trial {self.trial.number} at epoch {epoch}")
+            self.pruned = True
+            engine.terminate()
@@ -0,0 +1,64 @@
+import queue
+import threading
+
+END_OF_EPOCH = object()
+
+
+# Iterates over one dataloader, and gives every batch to each consumer,
+# so that several trials in the same process train on the same batches.
+# Consumers are closed when their trial ends, and are skipped from then on.
+class SharedBatches:
+    def __init__(self, dataloader, num_consumers, buffer_size=2):
+        self.dataloader = dataloader
+        self.queues = [queue.Queue(buffer_size) for _ in range(num_consumers)]
+        self.closed = [threading.Event() for _ in range(num_consumers)]
+        self.consumers = [BatchConsumer(self, i) for i in range(num_consumers)]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def all_closed(self):
+        return all(c.is_set() for c in self.closed)
+
+    def produce(self):
+        while not self.all_closed():
+            for batch in self.dataloader:
+                self.put(batch)
+                if self.all_closed():
+                    return
+            self.put(END_OF_EPOCH)
+
+    def put(self, x):
+        for q, closed in zip(self.queues, self.closed):
+            while not closed.is_set():
+                try:
+                    q.put(x, timeout=1)
+                    break
+                except queue.Full:
+                    pass
+
+    def close(self, i):
+        self.closed[i].set()
+
+
+class BatchConsumer:
+    def __init__(self, shared, i):
+        self.shared = shared
+        self.i = i
+        self.dataset = shared.dataloader.dataset
+
+    def __len__(self):
+        return len(self.shared.dataloader)
+
+    def __iter__(self):
+        q = self.shared.queues[self.i]
+        while True:
+            x = q.get()
+            if x is END_OF_EPOCH:
+                return
+            yield x
+
+    def close(self):
+        self.shared.close(self.i)
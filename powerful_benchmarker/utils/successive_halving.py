@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+from ignite.engine import Events
+
+
+# The number of epochs each rung trains for.
+# The last rung is the full max_epochs, and every other rung
+# ends on a validation epoch, so that it has a score and a checkpoint to resume from.
+def get_rung_epochs(max_epochs, val_interval, num_rungs, eta):
+    output = []
+    for r in range(num_rungs):
+        epochs = math.ceil(max_epochs / eta ** (num_rungs - 1 - r) / val_interval)
+        output.append(min(max_epochs, epochs * val_interval))
+    return sorted(set(output))
+
+
+# Failed trials are never promoted
+def get_promoted(scores, eta):
+    valid = {k: v for k, v in scores.items() if not np.isnan(v)}
+    num_promoted = max(1, len(scores) // eta)
+    return sorted(valid, key=lambda k: valid[k], reverse=True)[:num_promoted]
+
+
+# The trainer still uses max_epochs, so the lr schedule is the same as
+# in a full-length trial, and a promoted trial continues where it stopped.
+class StopAtEpoch:
+    def __init__(self, stop_epoch):
+        self.stop_epoch = stop_epoch
+
+    def attach(self, framework):
+        # framework.run() adds the validation and checkpoint handlers just before the trainer starts,
+        # so this is added at STARTED to run after them.
+        def add_handler(engine):
+            engine.add_event_handler(Events.EPOCH_COMPLETED, self.stop)
+
+        framework.trainer.add_event_handler(Events.STARTED, add_handler)
+
+    def stop(self, engine):
+        if engine.state.epoch >= self.stop_epoch:
+            engine.terminate()
@@ -1,10 +1,13 @@
 import json
 import os
 import pathlib
+import shutil
 import subprocess
 
 import yaml
 
+from .local_executor import is_local_jobid, kill_local_job, local_job_is_running
+
 
 def convert_unknown_args(unknown_args):
     args = {}
@@ -63,31 +66,51 @@ def kill_all_jobs(exp_folder, jobids_file):
 
     if filetype == ".json":
         with open(all_jobids_filename, "r") as f:
-            jobids = json.load(f)
-        jobids = " ".join(list(jobids.keys()))
+            jobids = list(json.load(f).keys())
 
     else:
         with open(all_jobids_filename, "r") as f:
-            jobids = " ".join([line.rstrip("\n") for line in f])
+            jobids = [line.rstrip("\n") for line in f]
 
-    command = f"scancel {jobids}"
-    print("killing slurm jobs")
-    subprocess.run(command.split(" "))
+    local_jobids = [x for x in jobids if is_local_jobid(x)]
+    if len(local_jobids) > 0:
+        print("killing local jobs")
+        for x in local_jobids:
+            kill_local_job(x)
+
+    jobids = " ".join(x for x in jobids if not is_local_jobid(x))
+    if jobids and shutil.which("scancel") is None:
+        print(f"scancel not found, can't kill slurm jobs {jobids}")
+        return
+    if jobids:
+        command = f"scancel {jobids}"
+        print("killing slurm jobs")
+        subprocess.run(command.split(" "))
     print(f"deleting {jobids_file}")
     os.remove(all_jobids_filename)
 
 
-def jobs_that_are_still_running(exp_folder, jobids_file):
+# slurm might not be installed on machines that only run local jobs
+def running_slurm_jobids():
+    if shutil.which("squeue") is None:
+        print("squeue not found, so no slurm jobs are considered running")
+        return set()
     x = subprocess.run("squeue --nohead --format %F".split(" "), capture_output=True)
-    jobid_list = x.stdout.decode("utf-8").split("\n")
+    return set(x.stdout.decode("utf-8").split("\n"))
+
 
+def jobs_that_are_still_running(exp_folder, jobids_file):
     all_jobids_filename = os.path.join(exp_folder, jobids_file)
 
     if os.path.isfile(all_jobids_filename):
         with open(all_jobids_filename, "r") as f:
             y = list(json.load(f).keys())
 
-        return set(y).intersection(jobid_list)
+        running = {x for x in y if is_local_jobid(x) and local_job_is_running(x)}
+        slurm_jobids = {x for x in y if not is_local_jobid(x)}
+        if len(slurm_jobids) > 0:
+            running |= slurm_jobids.intersection(running_slurm_jobids())
+        return running
     return {}
 
 
@@ -0,0 +1,104 @@
+import math
+
+from ignite.engine import Events
+from pytorch_adapt.frameworks.ignite import utils as ignite_utils
+from pytorch_adapt.utils import common_functions as c_f
+from pytorch_adapt.weighters import get_multiple_loss_totals
+
+VAL_SCHEDULES = ["fixed", "geometric", "list", "loss_trend"]
+
+
+# first, first * ratio, first * ratio^2, ...
+def geometric_epochs(first, ratio, max_epochs):
+    epochs = [first]
+    while epochs[-1] < max_epochs:
+        epochs.append(max(epochs[-1] + 1, math.ceil(epochs[-1] * ratio)))
+    return epochs
+
+
+# Decides which epochs validation (and feature saving and checkpointing) happens on.
+# The last epoch is always validated.
+# In "loss_trend" mode, an epoch is validated if the mean training loss
+# has changed by more than loss_change (relative) since the last validated epoch.
+class ValSchedule:
+    def __init__(self, max_epochs, epochs=None, loss_change=None):
+        self.max_epochs = max_epochs
+        self.epochs = set(epochs) if epochs is not None else set()
+        self.epochs.add(max_epochs)
+        self.loss_change = loss_change
+        self.loss_sum, self.loss_count = 0, 0
+        self.last_validated_loss = None
+
+    def attach(self, framework):
+        if self.loss_change is None:
+            return
+        # these are added before framework.run() adds the validation handlers,
+        # so the decision for each epoch is made before validation is considered
+        framework.trainer.add_event_handler(
+            Events.ITERATION_COMPLETED, self.accumulate_loss
+        )
+        framework.trainer.add_event_handler(Events.EPOCH_COMPLETED, self.check_loss)
+
+    def accumulate_loss(self, engine):
+        losses = get_multiple_loss_totals(engine.state.output)
+        self.loss_sum += sum(losses.values())
+        self.loss_count += 1
+
+    def check_loss(self, engine):
+        if self.loss_count == 0:
+            return
+        loss = self.loss_sum / self.loss_count
+        self.loss_sum, self.loss_count = 0, 0
+        last = self.last_validated_loss
+        if last is None or abs(loss - last) > self.loss_change * abs(last):
+            c_f.LOGGER.info(f"mean loss is {loss:.4g}, validating this epoch")
+            self.epochs.add(engine.state.epoch)
+            self.last_validated_loss = loss
+
+    def should_validate(self, engine, epoch):
+        return epoch in self.epochs
+
+    def condition(self):
+        return Events.EPOCH_COMPLETED(event_filter=self.should_validate)
+
+
+def get_val_schedule(cfg):
+    if cfg.val_schedule == "geometric":
+        epochs = geometric_epochs(
+            cfg.val_interval, cfg.val_schedule_ratio, cfg.max_epochs
+        )
+        return ValSchedule(cfg.max_epochs, epochs=epochs)
+    if cfg.val_schedule == "list":
+        return ValSchedule(cfg.max_epochs, epochs=cfg.val_epochs)
+    if cfg.val_schedule == "loss_trend":
+        return ValSchedule(cfg.max_epochs, loss_change=cfg.val_loss_change)
+    return None
+
+
+def with_val_schedule(framework_cls, val_schedule):
+    class ScheduledValidation(framework_cls):
+        def add_checkpoint_fn(self, condition, dataloaders):
+            super().add_checkpoint_fn(val_schedule.condition(), dataloaders)
+
+        def add_validation_runner(self, condition, dataloaders):
+            # check_initial_score uses Events.STARTED
+            if condition is not Events.STARTED:
+                condition = val_schedule.condition()
+            super().add_validation_runner(condition, dataloaders)
+
+        # The early stopper reads the latest score,
+        # so it only runs after validation, and patience counts validations.
+        def add_early_stopper(self, val_interval, **kwargs):
+            def score_fn(_):
+                return self.validator.latest_score
+
+            self.add_temp_event_handler(
+                val_schedule.condition(),
+                ignite_utils.early_stopper(**kwargs)(
+                    trainer=self.trainer,
+                    score_function=score_fn,
+                ),
+            )
+
+    ScheduledValidation.__name__ = framework_cls.__name__
+    return ScheduledValidation
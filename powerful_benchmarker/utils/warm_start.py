@@ -0,0 +1,127 @@
+import copy
+import os
+
+import joblib
+import numpy as np
+import optuna
+from optuna.samplers import BaseSampler
+from optuna.trial import TrialState
+
+
+# Scores from different tasks aren't comparable, so each score is replaced
+# by its rank among the completed trials of the same study, scaled to [0, 1].
+def normalized_values(trials):
+    trials = [t for t in trials if t.state == TrialState.COMPLETE]
+    ranks = np.argsort(np.argsort([t.value for t in trials]))
+    denominator = max(1, len(trials) - 1)
+    return {t.number: float(r / denominator) for t, r in zip(trials, ranks)}
+
+
+def normalize_scores(trials):
+    values = normalized_values(trials)
+    return [
+        optuna.trial.create_trial(
+            params=t.params,
+            distributions=t.distributions,
+            value=values[t.number],
+        )
+        for t in trials
+        if t.number in values
+    ]
+
+
+# Loads <exp_folder>/../<exp_group>/<exp_name>/study.pkl for each exp_group
+def load_warm_start_trials(exp_folder, exp_name, exp_groups):
+    root_exp_folder = os.path.dirname(os.path.normpath(exp_folder))
+    trials = []
+    for exp_group in exp_groups:
+        study_path = os.path.join(root_exp_folder, exp_group, exp_name, "study.pkl")
+        if not os.path.isfile(study_path):
+            print(f"{study_path} not found, skipping")
+            continue
+        curr_trials = normalize_scores(joblib.load(study_path).trials)
+        print(f"loaded {len(curr_trials)} warm start trials from {study_path}")
+        trials.extend(curr_trials)
+    return trials
+
+
+# The study that the wrapped sampler sees.
+# Its trials are the warm start trials plus all of this study's trials,
+# with the scores of the completed trials normalized.
+# Running and pruned trials are kept, so constant_liar and pruning still work.
+# Everything else, like storage writes for the current trial,
+# goes to the real study.
+class WarmStartStudy:
+    def __init__(self, study, warm_start_trials):
+        self.study = study
+        self.warm_start_trials = warm_start_trials
+
+    def get_trials(self, deepcopy=True, states=None, **kwargs):
+        trials = self.study.get_trials(deepcopy=False)
+        values = normalized_values(trials)
+        output = list(self.warm_start_trials)
+        for t in trials:
+            if t.number in values:
+                t = copy.copy(t)
+                t.value = values[t.number]
+            output.append(t)
+        if states is not None:
+            output = [t for t in output if t.state in states]
+        return copy.deepcopy(output) if deepcopy else output
+
+    # optuna's samplers use the private version, which can use a cache
+    _get_trials = get_trials
+
+    @property
+    def trials(self):
+        return self.get_trials()
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["study"], name)
+
+
+# The warm start trials aren't added to the study itself,
+# so they don't count towards num_trials and don't appear in trials.csv.
+class WarmStartSampler(BaseSampler):
+    def __init__(self, sampler, warm_start_trials):
+        self.sampler = sampler
+        self.warm_start_trials = warm_start_trials
+        # negative and increasing, so they come before the study's trials
+        for i, t in enumerate(self.warm_start_trials):
+            t.number = i - len(self.warm_start_trials)
+
+    def with_warm_start(self, study):
+        return WarmStartStudy(study, self.warm_start_trials)
+
+    def infer_relative_search_space(self, study, trial):
+        return self.sampler.infer_relative_search_space(
+            self.with_warm_start(study), trial
+        )
+
+    def sample_relative(self, study, trial, search_space):
+        return self.sampler.sample_relative(
+            self.with_warm_start(study), trial, search_space
+        )
+
+    def sample_independent(self, study, trial, param_name, param_distribution):
+        return self.sampler.sample_independent(
+            self.with_warm_start(study), trial, param_name, param_distribution
+        )
+
+    def before_trial(self, study, trial):
+        self.sampler.before_trial(study, trial)
+
+    def after_trial(self, study, trial, state, values):
+        self.sampler.after_trial(study, trial, state, values)
+
+    def reseed_rng(self):
+        self.sampler.reseed_rng()
+
+
+def get_warm_start_sampler(cfg, sampler):
+    if not cfg.warm_start_groups:
+        return sampler
+    trials = load_warm_start_trials(
+        cfg.exp_folder, cfg.exp_name, cfg.warm_start_groups
+    )
+    return WarmStartSampler(sampler, trials)
@@ -0,0 +1,66 @@
+import collections
+import json
+import math
+import os
+
+import numpy as np
+from ignite.engine import Events
+from pytorch_adapt.utils import common_functions as c_f
+
+from .constants import FAILURE_REASON_FILENAME
+
+
+# Stops training as soon as a logged loss is non-finite,
+# or when the mean absolute value of a loss over the last "window" iterations
+# is more than "divergence_factor" times the lowest such mean seen so far.
+class LossWatchdog:
+    def __init__(self, logger, config_path, window=100, divergence_factor=1000):
+        self.logger = logger
+        self.config_path = config_path
+        self.window = window
+        self.divergence_factor = divergence_factor
+        self.history = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window)
+        )
+        self.lowest_mean = {}
+        self.failure_reason = None
+
+    def attach(self, framework):
+        framework.trainer.add_event_handler(Events.ITERATION_COMPLETED, self.check)
+
+    def check(self, engine):
+        reason = self.get_failure_reason(self.logger.latest_losses())
+        if reason is None:
+            return
+        c_f.LOGGER.info(f"stopping training: {reason}")
+        self.failure_reason = reason
+        self.save(engine.state)
+        engine.terminate()
+
+    def get_failure_reason(self, losses):
+        for k, v in losses.items():
+            if not math.isfinite(v):
+                return f"{k} is {v}"
+            history = self.history[k]
+            history.append(abs(v))
+            if len(history) < self.window:
+                continue
+            mean = np.mean(history)
+            lowest = self.lowest_mean.get(k, mean)
+            if mean > self.divergence_factor * max(lowest, 1e-8):
+                return f"{k} diverged: mean of last {self.window} iterations is {mean:.4g}, lowest was {lowest:.4g}"
+            self.lowest_mean[k] = min(lowest, mean)
+        return None
+
+    def save(self, state):
+        c_f.makedir_if_not_there(self.config_path)
+        with open(os.path.join(self.config_path, FAILURE_REASON_FILENAME), "w") as f:
+            json.dump(
+                {
+                    "reason": self.failure_reason,
+                    "epoch": state.epoch,
+                    "iteration": state.iteration,
+                },
+                f,
+                indent=2,
+            )
@@ -57,6 +57,9 @@ def read_trials_csv(e):
     if os.path.isfile(filepath):
         trials = pd.read_csv(filepath)
         num_success = len(trials[trials["state"] == "COMPLETE"])
+        num_pruned = len(trials[trials["state"] == "PRUNED"])
+        if num_pruned > 0:
+            return f"{num_success} / {len(trials)} ({num_pruned} pruned)"
         return f"{num_success} / {len(trials)}"
     return "0 / 0"
 
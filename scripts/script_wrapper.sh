@@ -5,6 +5,9 @@ command=$2
 
 echo "Command to be wrapped: $command"
 
-conda deactivate && conda activate ${conda_env}
+# conda_env is "None" when it isn't set in constants.yaml (e.g. for local runs)
+if [ "${conda_env}" != "None" ]; then
+	conda deactivate && conda activate ${conda_env}
+fi
 
 ${command}
\ No newline at end of file
@@ -2,9 +2,8 @@ import argparse
 import os
 import subprocess
 
-import submitit
-
 from powerful_benchmarker.utils.constants import add_default_args
+from powerful_benchmarker.utils.local_executor import add_executor_args, get_executor
 from powerful_benchmarker.utils.utils import create_slurm_args
 from validator_tests.utils import utils
 from validator_tests.utils.constants import add_exp_group_args, exp_group_args
@@ -17,9 +16,7 @@ def exp_launcher(conda_env, command):
 
 
 def run(args, slurm_args, exp_group):
-    executor = submitit.AutoExecutor(
-        folder=os.path.join(args.exp_folder, args.slurm_folder)
-    )
+    executor = get_executor(args, os.path.join(args.exp_folder, args.slurm_folder))
     executor.update_parameters(
         timeout_min=0,
         tasks_per_node=1,
@@ -54,6 +51,7 @@ if __name__ == "__main__":
     parser.add_argument("--slurm_config_folder", type=str, required=True)
     parser.add_argument("--slurm_config", type=str, required=True)
     parser.add_argument("--all_in_one", action="store_true")
+    add_executor_args(parser)
     args, unknown_args = parser.parse_known_args()
     slurm_args = create_slurm_args(args, unknown_args, args.slurm_config_folder)
     main(args, slurm_args)
@@ -0,0 +1,58 @@
+import unittest
+
+import torch
+
+from powerful_benchmarker.utils.batch_augmentation import (
+    BatchAugmentation,
+    pad_and_stack,
+    random_crop,
+)
+
+
+# The value of each pixel is 1 + its column index // 2,
+# so padding (0) can be detected, and the crop's left edge can be recovered.
+def get_image(height, width):
+    cols = torch.arange(width).view(1, 1, width).expand(3, height, width)
+    return (1 + cols // 2).to(torch.uint8)
+
+
+class TestBatchAugmentation(unittest.TestCase):
+    def test_pad_and_stack(self):
+        images = [get_image(256, 300), get_image(320, 256)]
+        x, heights, widths = pad_and_stack(images)
+        self.assertEqual(x.shape, (2, 3, 320, 300))
+        self.assertEqual(heights.tolist(), [256, 320])
+        self.assertEqual(widths.tolist(), [300, 256])
+        self.assertTrue(torch.equal(x[0, :, :, :300][:, :256], images[0]))
+        self.assertTrue(torch.all(x[0, :, 256:] == 0))
+        self.assertTrue(torch.all(x[1, :, :, 256:] == 0))
+
+    def test_random_crop(self):
+        torch.manual_seed(0)
+        images = [get_image(256, 400 if i % 2 == 0 else 256) for i in range(200)]
+        x, heights, widths = pad_and_stack(images)
+        x = random_crop(x, 224, heights, widths)
+        self.assertEqual(x.shape, (200, 3, 224, 224))
+        # crops never include padding
+        self.assertTrue(torch.all(x > 0))
+        # crops cover the whole width of the wide images
+        left = (x[::2, 0, 0, 0].long() - 1) * 2
+        self.assertLess(left.min().item(), 20)
+        self.assertGreater(left.max().item(), 150)
+        self.assertLessEqual(left.max().item(), 400 - 224)
+
+    def test_batch_augmentation(self):
+        samples = [
+            {
+                "src_imgs": get_image(256, 256 + i * 20),
+                "src_labels": i,
+                "target_imgs": get_image(256 + i * 10, 256),
+            }
+            for i in range(4)
+        ]
+        batch = BatchAugmentation()(samples)
+        self.assertEqual(batch["src_labels"].tolist(), [0, 1, 2, 3])
+        for k in ["src_imgs", "target_imgs"]:
+            self.assertEqual(batch[k].shape, (4, 3, 224, 224))
+            self.assertEqual(batch[k].dtype, torch.float32)
+            self.assertTrue(torch.all(batch[k].abs() < 3))
@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+
+from validator_tests.run_validators import (
+    get_command_cost,
+    split_into_batches_by_cost,
+)
+from validator_tests.utils import cost_model
+
+
+class TestCostModel(unittest.TestCase):
+    def test_split_into_batches_by_cost(self):
+        costs = [2, 7, 4, 6, 3, 5]
+        to_run = [f"command{i}" for i in range(len(costs))]
+        batches = split_into_batches_by_cost(to_run, costs, 2)
+        self.assertEqual(len(batches), 3)
+        self.assertTrue(all(len(b) == 2 for b in batches))
+        self.assertEqual(sorted(sum(batches, [])), sorted(to_run))
+        batch_costs = [sum(costs[int(c[-1])] for c in b) for b in batches]
+        self.assertEqual(batch_costs, [9, 9, 9])
+
+    def test_unknown_cost(self):
+        self.assertEqual(get_command_cost(None, (0, 10), 2), 20)
+        self.assertEqual(get_command_cost(3, (0, 10), 2), 30)
+        self.assertEqual(get_command_cost(None, (0, 10), None), 10)
+
+    def test_timings(self):
+        with tempfile.TemporaryDirectory() as exp_folder:
+            self.assertIsNone(cost_model.get_default_seconds_per_trial(exp_folder))
+            for validator, seconds in [("A", 1), ("A", 3), ("B", 10)]:
+                cost_model.append_timing(
+                    exp_folder,
+                    {
+                        "validator": validator,
+                        "flag_args": "x",
+                        "dataset": "mnist",
+                        "seconds": seconds,
+                    },
+                )
+            fn = cost_model.get_seconds_per_trial_fn(exp_folder)
+            self.assertEqual(fn("A", "y", "office31"), 2)
+            self.assertIsNone(fn("C", "x", "mnist"))
+            self.assertEqual(cost_model.get_default_seconds_per_trial(exp_folder), 3)
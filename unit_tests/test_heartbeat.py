@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from powerful_benchmarker.utils.constants import HEARTBEAT_FILENAME
+from powerful_benchmarker.utils.heartbeat import Heartbeat, heartbeat_callback
+
+
+def read_heartbeat(folder):
+    with open(os.path.join(folder, HEARTBEAT_FILENAME), "r") as f:
+        return json.load(f)
+
+
+class Hook:
+    def __init__(self):
+        self.calls = 0
+        self.epoch = 3
+
+    def __call__(self, epoch, **kwargs):
+        self.calls += 1
+        return kwargs
+
+
+class TestHeartbeat(unittest.TestCase):
+    def test_beat(self):
+        with tempfile.TemporaryDirectory() as folder:
+            heartbeat = Heartbeat(folder, "5", min_interval=100)
+            heartbeat.beat()
+            self.assertEqual(
+                {k: v for k, v in read_heartbeat(folder).items() if k != "timestamp"},
+                {"trial": "5", "iteration": 0, "epoch": 0},
+            )
+            heartbeat.state = SimpleNamespace(iteration=10, epoch=2)
+            heartbeat.beat()
+            self.assertEqual(read_heartbeat(folder)["iteration"], 0)
+            heartbeat.beat(force=True)
+            self.assertEqual(read_heartbeat(folder)["iteration"], 10)
+            self.assertEqual(read_heartbeat(folder)["epoch"], 2)
+
+    def test_val_hooks(self):
+        with tempfile.TemporaryDirectory() as folder:
+            heartbeat = Heartbeat(folder, "5", min_interval=100)
+            hook = Hook()
+            [wrapped] = heartbeat.wrap_val_hooks([hook])
+            self.assertEqual(wrapped(1, a=2), {"a": 2})
+            self.assertEqual(hook.calls, 1)
+            self.assertEqual(wrapped.epoch, 3)
+            self.assertEqual(read_heartbeat(folder)["trial"], "5")
+            os.remove(os.path.join(folder, HEARTBEAT_FILENAME))
+            wrapped(1)
+            # written even though min_interval hasn't passed
+            self.assertEqual(read_heartbeat(folder)["trial"], "5")
+
+    def test_callback(self):
+        with tempfile.TemporaryDirectory() as folder:
+            heartbeat_callback(folder)(None, SimpleNamespace(number=4))
+            self.assertEqual(read_heartbeat(folder)["trial"], "4")
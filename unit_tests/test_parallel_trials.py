@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+import optuna
+from optuna.trial import TrialState
+
+from powerful_benchmarker.utils import main_utils
+
+
+def worker(exp_path, num_trials):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = optuna.load_study(
+        study_name=main_utils.STUDY_NAME,
+        storage=main_utils.get_study_storage(exp_path),
+    )
+    ask = study.ask
+
+    # so that, without the lock, workers would count the same trials
+    def slow_ask():
+        time.sleep(0.05)
+        return ask()
+
+    study.ask = slow_ask
+    while True:
+        trial = main_utils.ask_within_budget(study, exp_path, num_trials)
+        if trial is None:
+            break
+        # failed trials don't count towards num_trials
+        if trial.number % 4 == 0:
+            study.tell(trial, state=TrialState.FAIL)
+        else:
+            study.tell(trial, trial.suggest_float("x", 0, 1))
+
+
+class TestParallelTrials(unittest.TestCase):
+    def test_ask_within_budget(self):
+        num_trials = 10
+        with tempfile.TemporaryDirectory() as exp_path:
+            storage = main_utils.get_study_storage(exp_path)
+            optuna.create_study(study_name=main_utils.STUDY_NAME, storage=storage)
+            workers = [
+                multiprocessing.Process(target=worker, args=(exp_path, num_trials))
+                for _ in range(4)
+            ]
+            for p in workers:
+                p.start()
+            for p in workers:
+                p.join()
+            study = optuna.load_study(
+                study_name=main_utils.STUDY_NAME,
+                storage=main_utils.get_study_storage(exp_path),
+            )
+            states = [t.state for t in study.trials]
+            self.assertEqual(states.count(TrialState.COMPLETE), num_trials)
+            self.assertEqual(states.count(TrialState.RUNNING), 0)
+            self.assertTrue(os.path.isfile(os.path.join(exp_path, "ask.lock")))
@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import unittest
+
+from powerful_benchmarker.utils.perf_telemetry import PHASES, PerfTelemetry
+
+
+def get_epoch(epoch, elapsed_seconds):
+    x = {k: 1 for k in PHASES}
+    x["images"] = 10
+    x["epoch"] = epoch
+    x["elapsed_seconds"] = elapsed_seconds
+    return x
+
+
+class TestPerfTelemetry(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            telemetry = PerfTelemetry(folder)
+            epochs = [get_epoch(i, i * 100) for i in range(1, 5)]
+            with open(telemetry.filepath, "w") as f:
+                json.dump({"summary": {"total_seconds": 450}, "epochs": epochs}, f)
+
+            telemetry.load(2)
+            self.assertEqual([e["epoch"] for e in telemetry.epochs], [1, 2])
+            # the time spent on epochs 3 and 4 is dropped
+            self.assertEqual(telemetry.previous_seconds, 200)
+            self.assertEqual(telemetry.totals["train"], 2)
+            self.assertEqual(telemetry.totals["images"], 20)
+
+            telemetry = PerfTelemetry(folder)
+            telemetry.load(0)
+            self.assertEqual(telemetry.epochs, [])
+            self.assertEqual(telemetry.previous_seconds, 0)
+
+    def test_summary(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for process_peaks in [True, False]:
+                telemetry = PerfTelemetry(folder, process_peaks=process_peaks)
+                telemetry.start_time = 0
+                summary = telemetry.summary()
+                self.assertEqual("process_peak_rss_mb" in summary, process_peaks)
+                self.assertNotIn("peak_rss_mb", summary)
+            telemetry.write()
+            self.assertTrue(os.path.isfile(telemetry.filepath))
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+import joblib
+import optuna
+from optuna.trial import TrialState
+
+from powerful_benchmarker.utils import main_utils
+
+
+def objective(trial):
+    return trial.suggest_float("x", 0, 1)
+
+
+class TestTrialsJournal(unittest.TestCase):
+    def test_replay(self):
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        with tempfile.TemporaryDirectory() as exp_path:
+            study_path = os.path.join(exp_path, "study.pkl")
+            append = main_utils.append_to_trials_journal(exp_path)
+            save = main_utils.save_study(study_path)
+            study = optuna.create_study(direction="maximize")
+            study.optimize(objective, n_trials=2, callbacks=[append])
+            # asked before compaction, like in successive halving
+            running = study.ask()
+            running.suggest_float("x", 0, 1)
+            save(study, None)
+            self.assertEqual(main_utils.read_trials_journal(exp_path), [])
+
+            running.report(0.5, 1)
+            study.tell(running, 0.5)
+            append(study, study.trials[running.number])
+            study.optimize(objective, n_trials=1, callbacks=[append])
+            pruned = study.ask()
+            pruned.suggest_float("x", 0, 1)
+            study.tell(pruned, state=TrialState.PRUNED)
+            append(study, study.trials[pruned.number])
+            self.assertEqual(len(main_utils.read_trials_journal(exp_path)), 3)
+
+            loaded = joblib.load(study_path)
+            self.assertEqual(loaded.trials[2].state, TrialState.RUNNING)
+            main_utils.replay_trials_journal(loaded, exp_path)
+            self.assertEqual(len(loaded.trials), 5)
+            for x, y in zip(loaded.trials, study.trials):
+                self.assertEqual(x.state, y.state)
+                self.assertEqual(x.params, y.params)
+                if x.state == TrialState.COMPLETE:
+                    self.assertEqual(x.value, y.value)
+            self.assertEqual(loaded.trials[2].intermediate_values, {1: 0.5})
+
+            save(loaded, None)
+            self.assertEqual(main_utils.read_trials_journal(exp_path), [])
+
+    def test_missing_trials_are_failed(self):
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        with tempfile.TemporaryDirectory() as exp_path:
+            append = main_utils.append_to_trials_journal(exp_path)
+            study = optuna.create_study(direction="maximize")
+            trials = [study.ask() for _ in range(3)]
+            for t in trials[1:]:
+                study.tell(t, objective(t))
+                append(study, study.trials[t.number])
+
+            loaded = optuna.create_study(direction="maximize")
+            main_utils.replay_trials_journal(loaded, exp_path)
+            states = [t.state for t in loaded.trials]
+            self.assertEqual(
+                states, [TrialState.FAIL, TrialState.COMPLETE, TrialState.COMPLETE]
+            )
+
+    def test_every_n_trials(self):
+        calls = []
+        fn = main_utils.every_n_trials(3, [lambda s, t: calls.append(t)])
+        for i in range(7):
+            # trial numbers from other workers aren't seen by this process
+            fn(None, i * 2)
+        self.assertEqual(calls, [4, 10])
@@ -0,0 +1,30 @@
+import unittest
+from types import SimpleNamespace
+
+from powerful_benchmarker.utils.val_schedule import ValSchedule, geometric_epochs
+
+
+def get_engine(epoch, loss=None):
+    output = {"total_loss": {"total": loss}}
+    return SimpleNamespace(state=SimpleNamespace(epoch=epoch, output=output))
+
+
+class TestValSchedule(unittest.TestCase):
+    def test_geometric_epochs(self):
+        self.assertEqual(geometric_epochs(1, 2, 10), [1, 2, 4, 8, 16])
+        self.assertEqual(geometric_epochs(2, 1.2, 5), [2, 3, 4, 5])
+
+    def test_epochs(self):
+        schedule = ValSchedule(10, epochs=[1, 3])
+        validated = [e for e in range(1, 11) if schedule.should_validate(None, e)]
+        self.assertEqual(validated, [1, 3, 10])
+
+    def test_loss_trend(self):
+        schedule = ValSchedule(10, loss_change=0.1)
+        for epoch, loss in enumerate([1, 1.05, 0.8, 0.75, 0.7], start=1):
+            for _ in range(3):
+                schedule.accumulate_loss(get_engine(epoch, loss))
+            schedule.check_loss(get_engine(epoch))
+        validated = [e for e in range(1, 11) if schedule.should_validate(None, e)]
+        # 0.7 is more than 10% away from 0.8, the last validated loss
+        self.assertEqual(validated, [1, 3, 5, 10])
@@ -0,0 +1,85 @@
+import unittest
+
+import optuna
+from optuna.samplers import TPESampler
+from optuna.trial import TrialState
+
+from powerful_benchmarker.utils.warm_start import (
+    WarmStartSampler,
+    WarmStartStudy,
+    normalize_scores,
+)
+
+
+def get_warm_start_trials(n_trials):
+    study = optuna.create_study(direction="maximize")
+    study.optimize(lambda t: t.suggest_float("x", 0, 10), n_trials=n_trials)
+    return normalize_scores(study.trials)
+
+
+def objective(trial):
+    x = trial.suggest_float("x", 0, 10)
+    if trial.number % 3 == 1:
+        trial.report(x, 0)
+        raise optuna.TrialPruned()
+    return x
+
+
+class TestWarmStart(unittest.TestCase):
+    def test_normalize_scores(self):
+        trials = get_warm_start_trials(5)
+        self.assertEqual(sorted(t.value for t in trials), [0, 0.25, 0.5, 0.75, 1])
+
+    def test_with_tpe(self):
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        for constant_liar in [False, True]:
+            sampler = TPESampler(
+                n_startup_trials=5, constant_liar=constant_liar, seed=0
+            )
+            sampler = WarmStartSampler(sampler, get_warm_start_trials(10))
+            study = optuna.create_study(direction="maximize", sampler=sampler)
+            study.optimize(objective, n_trials=10)
+            states = [t.state for t in study.trials]
+            self.assertEqual(len(states), 10)
+            self.assertEqual(states.count(TrialState.FAIL), 0)
+            self.assertEqual(states.count(TrialState.PRUNED), 3)
+
+    # like parallel workers, which use constant_liar
+    def test_concurrent_trials(self):
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        sampler = TPESampler(n_startup_trials=5, constant_liar=True, seed=0)
+        sampler = WarmStartSampler(sampler, get_warm_start_trials(10))
+        study = optuna.create_study(direction="maximize", sampler=sampler)
+        for _ in range(3):
+            trials = [study.ask() for _ in range(3)]
+            for t in trials:
+                study.tell(t, t.suggest_float("x", 0, 10))
+        self.assertEqual(len(study.trials), 9)
+        self.assertTrue(all(t.state == TrialState.COMPLETE for t in study.trials))
+
+    def test_sampler_sees_all_trials(self):
+        warm_start_trials = get_warm_start_trials(4)
+        study = optuna.create_study(direction="maximize")
+        study.optimize(objective, n_trials=3)
+        running = study.ask()
+        x = WarmStartStudy(study, warm_start_trials)
+        trials = x.get_trials(deepcopy=False)
+        self.assertEqual(len(trials), 8)
+        self.assertEqual(
+            len(x._get_trials(deepcopy=False, states=(TrialState.RUNNING,))), 1
+        )
+        self.assertEqual(
+            len(x.get_trials(deepcopy=False, states=(TrialState.PRUNED,))), 1
+        )
+        # writes go to the real study
+        x._storage.set_trial_system_attr(running._trial_id, "a", 1)
+        self.assertEqual(study.trials[-1].system_attrs["a"], 1)
+        # the study's own trials are unchanged
+        complete = [t for t in study.trials if t.state == TrialState.COMPLETE]
+        self.assertTrue(all(t.value != 0 and t.value != 1 for t in complete))
+        normalized = [
+            t.value
+            for t in trials
+            if t.number >= 0 and t.state == TrialState.COMPLETE
+        ]
+        self.assertEqual(sorted(normalized), [0, 1])
@@ -19,6 +19,10 @@ def scatter(plots_folder, df, per_feature_layer):
         kwargs["font_scale"] = args.font_scale
     if args.figsize:
         kwargs["figsize"] = args.figsize
+    if args.bin_type:
+        kwargs["bin_type"] = args.bin_type
+        kwargs["num_bins"] = args.num_bins
+        kwargs["save_bins"] = args.save_bins
     plot_val_vs_acc(
         df,
         plots_folder,
@@ -74,8 +78,13 @@ if __name__ == "__main__":
     parser.add_argument("--dot_size", type=float, default=None)
     parser.add_argument("--font_scale", type=float, default=None)
     parser.add_argument("--figsize", nargs="+", type=float, default=None)
+    parser.add_argument("--bin_type", type=str, choices=["hist2d", "hexbin"])
+    parser.add_argument("--num_bins", type=int, default=200)
+    parser.add_argument("--save_bins", action="store_true")
     parser.add_argument("--per_adapter", action="store_true")
     parser.add_argument("--adapter", type=str)
     parser.add_argument("--fn_list", nargs="+", type=str, default=[])
     args = parser.parse_args()
+    if args.save_bins and not args.bin_type:
+        raise ValueError("--save_bins requires --bin_type")
     create_main.main(args, *get_fns(args.fn_list))
@@ -1,8 +1,8 @@
 import argparse
-import copy
 import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from functools import partialmethod
 
 logging.basicConfig()
@@ -11,27 +11,18 @@ logging.getLogger("pytorch-adapt").setLevel(logging.INFO)
 
 import pandas as pd
 import torch
+import torch.multiprocessing as mp
 from tqdm import tqdm
 
 sys.path.insert(0, ".")
-from pytorch_adapt.utils import common_functions as c_f
-
 from powerful_benchmarker.utils.constants import add_default_args
 from powerful_benchmarker.utils.utils import convert_unknown_args
 from validator_tests import configs
-from validator_tests.utils import utils
-from validator_tests.utils.constants import VALIDATOR_TESTS_FOLDER
+from validator_tests.utils import cost_model, utils
+from validator_tests.utils.score_utils import get_and_save_scores
 
 tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-
-def assert_curr_dict(curr_dict):
-    x = set(curr_dict.keys()).intersection({"validator", "validator_args", "score"})
-    if len(x) > 0:
-        raise KeyError("curr_dict already has some validation related keys")
-
 
 def save_df(validator_name, validator_args_str, all_scores):
     def fn(folder):
@@ -39,58 +30,25 @@ def save_df(validator_name, validator_args_str, all_scores):
         filepath = utils.get_df_filepath(folder, validator_name, validator_args_str)
         df.to_pickle(filepath)
         all_scores.clear()
+        return len(df)
 
     return fn
 
 
-def get_and_save_scores(
-    validator_name,
-    validator,
-    validator_args_str,
-    all_scores,
-    skip_validator_errors,
-):
-    def fn(epoch, x, exp_config, exp_folder):
-        if isinstance(validator, configs.DEV):
-            # temporarily appending epoch to folder name
-            # because of folder deletion problem
-            temp_folder = os.path.join(
+def save_timing(exp_folder, timing_info, timings):
+    def fn(folder):
+        if len(timings["seconds"]) > 0:
+            cost_model.append_timing(
                 exp_folder,
-                VALIDATOR_TESTS_FOLDER,
-                f"{utils.validator_str(validator_name, validator_args_str)}_{epoch}",
+                {
+                    **timing_info,
+                    "dataset": timings["dataset"],
+                    "trial_folder": folder,
+                    "num_epochs": len(timings["seconds"]),
+                    "seconds": sum(timings["seconds"]),
+                },
             )
-            validator.validator.temp_folder = temp_folder
-            # temporarily disabling this
-            # if os.path.isdir(temp_folder):
-            # shutil.rmtree(temp_folder)  # delete any old copies
-        error_was_raised = False
-        try:
-            score = validator.score(x, exp_config, DEVICE)
-        except Exception as e:
-            if skip_validator_errors:
-                error_was_raised = True
-                c_f.LOGGER.info(e)
-                c_f.LOGGER.info(
-                    "Ignoring validator exception because skip_validator_errors is True"
-                )
-            else:
-                raise
-
-        if skip_validator_errors and error_was_raised:
-            return
-
-        curr_dict = copy.deepcopy(exp_config)
-        assert_curr_dict(curr_dict)
-        curr_dict["trial_params"] = utils.dict_to_str(curr_dict["trial_params"])
-        curr_dict["epoch"] = epoch
-        curr_dict.update(
-            {
-                "validator": validator_name,
-                "validator_args": validator_args_str,
-                "score": score,
-            }
-        )
-        all_scores.append(curr_dict)
+        timings["seconds"].clear()
 
     return fn
 
@@ -115,6 +73,87 @@ def get_validator_and_condition_fn(
     return validator, validator_args_str, exp_folders, condition_fn
 
 
+def get_fn_and_end_fn(args, validator, validator_args, validator_args_str):
+    all_scores = []
+    timings = {"dataset": None, "seconds": []}
+    fn = get_and_save_scores(
+        args.validator,
+        validator,
+        validator_args_str,
+        all_scores,
+        args.skip_validator_errors,
+        timings,
+    )
+    save_df_fn = save_df(args.validator, validator_args_str, all_scores)
+    timing_info = {
+        "validator": args.validator,
+        "flag_args": utils.dict_to_str(validator_args),
+        "exp_group": args.exp_group,
+        "exp_name": args.exp_name,
+    }
+    save_timing_fn = save_timing(args.exp_folder, timing_info, timings)
+
+    def end_fn(folder):
+        num_rows = save_df_fn(folder)
+        save_timing_fn(folder)
+        return num_rows
+
+    return fn, end_fn
+
+
+def init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def score_one_exp_folder(args, validator_args, exp_folder):
+    validator = getattr(configs, args.validator)(validator_args)
+    validator_args_str = utils.dict_to_str(validator.validator_args)
+    fn, end_fn = get_fn_and_end_fn(
+        args, validator, validator_args, validator_args_str
+    )
+    num_rows = []
+    utils.apply_to_data(
+        [exp_folder],
+        lambda *_: True,
+        fn,
+        lambda folder: num_rows.append(end_fn(folder)),
+    )
+    return exp_folder, num_rows[0]
+
+
+def get_num_threads_per_worker(num_workers, num_threads_per_worker):
+    if num_threads_per_worker is not None:
+        return num_threads_per_worker
+    return max(1, os.cpu_count() // num_workers)
+
+
+# Each worker scores whole trial folders and writes their pkls itself,
+# so the output is identical to the serial version.
+def run_with_process_pool(args, validator_args, exp_folders, condition_fn):
+    to_run = [e for i, e in enumerate(exp_folders) if condition_fn(i, e)]
+    num_threads = get_num_threads_per_worker(
+        args.num_workers, args.num_threads_per_worker
+    )
+    print(
+        f"scoring {len(to_run)} folders with {args.num_workers} workers, {num_threads} threads each"
+    )
+    with ProcessPoolExecutor(
+        max_workers=args.num_workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(num_threads,),
+    ) as executor:
+        results = executor.map(
+            score_one_exp_folder,
+            [args] * len(to_run),
+            [validator_args] * len(to_run),
+            to_run,
+        )
+        num_rows = dict(results)
+    print(f"saved {sum(num_rows.values())} rows across {len(num_rows)} folders")
+    return num_rows
+
+
 def main(args, validator_args):
     (
         validator,
@@ -130,15 +169,12 @@ def main(args, validator_args):
         args.exp_name,
         args.use_glob,
     )
-    all_scores = []
-    fn = get_and_save_scores(
-        args.validator,
-        validator,
-        validator_args_str,
-        all_scores,
-        args.skip_validator_errors,
+    if args.num_workers > 1:
+        run_with_process_pool(args, validator_args, exp_folders, condition_fn)
+        return
+    fn, end_fn = get_fn_and_end_fn(
+        args, validator, validator_args, validator_args_str
     )
-    end_fn = save_df(args.validator, validator_args_str, all_scores)
     utils.apply_to_data(exp_folders, condition_fn, fn, end_fn)
 
 
@@ -151,6 +187,8 @@ if __name__ == "__main__":
     parser.add_argument("--trial_range", nargs="+", type=int, default=[])
     parser.add_argument("--skip_validator_errors", action="store_true")
     parser.add_argument("--use_glob", action="store_true")
+    parser.add_argument("--num_workers", type=int, default=1)
+    parser.add_argument("--num_threads_per_worker", type=int, default=None)
     args, unknown_args = parser.parse_known_args()
     validator_args = convert_unknown_args(unknown_args)
     main(args, validator_args)
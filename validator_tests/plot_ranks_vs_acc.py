@@ -19,6 +19,7 @@ from validator_tests.eval_validators import (
     group_by_task_validator,
 )
 from validator_tests.utils import create_main
+from validator_tests.utils.binning_utils import bin_df
 from validator_tests.utils.constants import TARGET_ACCURACY, add_exp_group_args
 from validator_tests.utils.df_utils import get_name_from_df, unify_validator_columns
 from validator_tests.utils.plot_val_vs_acc import scatter_plot
@@ -63,7 +64,7 @@ def get_global_ranks(df, rank_by, per_adapter=True):
     return corr_with_ranks
 
 
-def plot_corr_vs_acc(df, max_rank, corr_name, folder, filename):
+def plot_corr_vs_acc(df, max_rank, corr_name, folder, filename, num_bins=None):
     to_plot = df[df["rank"] <= max_rank]
     to_plot = to_plot.sort_values(by=["adapter"])
     to_plot["adapter"] = to_plot["adapter"].str.replace("Config", "")
@@ -80,15 +81,25 @@ def plot_corr_vs_acc(df, max_rank, corr_name, folder, filename):
             else:
                 _to_plot = to_plot
                 hue = "Checkpoints Ranked By"
+            size_kwargs = {}
+            if num_bins:
+                _to_plot = bin_df(_to_plot, x, TARGET_ACCURACY, num_bins, groupby=hue)
+                # the number of points in each bin is shown by the marker size
+                size_kwargs = {"size": "count", "sizes": (10, 300)}
             sns.set(style="whitegrid", rc={"figure.figsize": (8, 8)})
             plot = sns.scatterplot(
-                data=_to_plot, x=x, y=TARGET_ACCURACY, hue=hue, alpha=0.5
+                data=_to_plot,
+                x=x,
+                y=TARGET_ACCURACY,
+                hue=hue,
+                alpha=0.5,
+                **size_kwargs,
             )
             plot.set(
                 xlabel=axis_label_dict(x, max_rank),
                 ylabel=axis_label_dict(TARGET_ACCURACY),
             )
-            if hue:
+            if hue or num_bins:
                 sns.move_legend(plot, "upper left", bbox_to_anchor=(1, 1))
             fig = plot.get_figure()
             c_f.makedir_if_not_there(folder)
@@ -99,8 +110,10 @@ def plot_corr_vs_acc(df, max_rank, corr_name, folder, filename):
             fig.clf()
 
 
-def plot_corr_vs_true_and_predicted(best, max_rank, corr_name, output_folder, filename):
-    plot_corr_vs_acc(best, max_rank, corr_name, output_folder, filename)
+def plot_corr_vs_true_and_predicted(
+    best, max_rank, corr_name, output_folder, filename, num_bins=None
+):
+    plot_corr_vs_acc(best, max_rank, corr_name, output_folder, filename, num_bins)
 
 
 def plot_corr_vs_nlargest(df, output_folder, filename, corr_name):
@@ -209,7 +222,7 @@ def get_corr_df(df, corr_name):
     return corr, corr_best_validators, corr_best_validators_across_tasks
 
 
-def main_fn(output_folder, df):
+def main_fn(output_folder, df, num_bins=None):
     corr_name = "weighted_spearman"
     corr, corr_best_validators, corr_best_validators_across_tasks = get_corr_df(
         df, corr_name
@@ -242,6 +255,8 @@ def main_fn(output_folder, df):
                 alpha=0.5,
                 x_label=axis_label_dict(corr_name),
                 y_label=axis_label_dict(TARGET_ACCURACY),
+                bin_type="hist2d" if num_bins else None,
+                num_bins=num_bins,
             )
 
         for nlargest in range(1, 11):
@@ -264,6 +279,7 @@ def main_fn(output_folder, df):
                 corr_name,
                 output_folder,
                 f"selected_models_local_{nlargest}_best_validators_{corr_df_name}",
+                num_bins,
             )
 
             best_by_score = get_global_ranks(corr_df.copy(), "score")
@@ -277,6 +293,7 @@ def main_fn(output_folder, df):
                 corr_name,
                 output_folder,
                 f"selected_models_global_{nlargest_global}_best_validators_{corr_df_name}",
+                num_bins,
             )
 
 
@@ -285,7 +302,7 @@ def get_fn(args):
         output_folder = os.path.join(
             output_folder, get_name_from_df(df, assert_one_task=True)
         )
-        return main_fn(output_folder, df)
+        return main_fn(output_folder, df, args.num_bins)
 
     return fn
 
@@ -295,6 +312,7 @@ if __name__ == "__main__":
     add_default_args(parser, ["exp_folder"])
     add_exp_group_args(parser)
     parser.add_argument("--output_folder", type=str, default="plots/ranks_vs_acc")
+    parser.add_argument("--num_bins", type=int, default=None)
     create_main.add_main_args(parser)
     args = parser.parse_args()
     create_main.main(args, get_fn(args), get_fn(args))
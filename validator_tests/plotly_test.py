@@ -1,5 +1,6 @@
 import argparse
 import json
+import os
 import sys
 
 import numpy as np
@@ -91,6 +92,34 @@ def create_plot(original_df, validator_name, validator_args):
     fig.write_html(f"plotly_test_{validator_str(validator_name, validator_args)}.html")
 
 
+# bins_df is the output of binning_utils.bins_to_df,
+# e.g. the pkl saved by create_plots.py --save_bins
+def create_binned_plot(bins_df, x, y, c=None, filename="plotly_binned"):
+    z = bins_df[c] if c is not None else bins_df["count"]
+    fig = go.Figure(
+        data=go.Heatmap(
+            x=bins_df[x],
+            y=bins_df[y],
+            z=z,
+            colorscale="viridis",
+        )
+    )
+    fig.update_layout(xaxis_title=x, yaxis_title=y)
+    fig.write_html(f"{filename}.html")
+
+
+def create_binned_plots(bins_files, x, y, c):
+    for f in bins_files:
+        bins_df = pd.read_pickle(f)
+        create_binned_plot(
+            bins_df,
+            x,
+            y,
+            c if c in bins_df.columns else None,
+            os.path.splitext(os.path.basename(f))[0],
+        )
+
+
 def create_subsets(output_folder, original_df):
     for validator_name in original_df["validator"].unique():
         curr_df = original_df[original_df["validator"] == validator_name]
@@ -104,5 +133,9 @@ if __name__ == "__main__":
     add_default_args(parser, ["exp_folder"])
     add_exp_group_args(parser)
     create_main.add_main_args(parser)
+    parser.add_argument("--bins_files", nargs="+", type=str, default=[])
     args = parser.parse_args()
-    create_main.main(args, create_subsets, create_subsets)
+    if args.bins_files:
+        create_binned_plots(args.bins_files, "score", TARGET_ACCURACY, "src_val_micro")
+    else:
+        create_main.main(args, create_subsets, create_subsets)
@@ -6,11 +6,15 @@ import subprocess
 import sys
 
 import numpy as np
-import submitit
 import torch
 
 sys.path.insert(0, ".")
 from powerful_benchmarker.utils.constants import add_default_args
+from powerful_benchmarker.utils.local_executor import (
+    add_executor_args,
+    get_executor,
+    get_local_rank,
+)
 from powerful_benchmarker.utils.utils import (
     append_jobid_to_file,
     create_slurm_args,
@@ -19,7 +23,13 @@ from powerful_benchmarker.utils.utils import (
 from validator_tests import flags as flags_module
 from validator_tests.main import get_validator_and_condition_fn
 from validator_tests.utils.constants import JOBIDS_FILENAME, add_exp_group_args
-from validator_tests.utils.utils import apply_to_data, get_exp_groups
+from validator_tests.utils.cost_model import (
+    get_default_seconds_per_trial,
+    get_seconds_per_trial_fn,
+)
+from validator_tests.utils.utils import apply_to_data, dict_to_str, get_exp_groups
+
+NUM_TRIALS = 100
 
 
 def split_into_batches(to_run, exp_per_slurm_job):
@@ -27,16 +37,58 @@ def split_into_batches(to_run, exp_per_slurm_job):
 
 
 def get_trial_ranges(trials_per_exp):
-    num_trials = 100
-    trial_nums = np.array_split(np.arange(num_trials), int(100 / trials_per_exp))
+    trial_nums = np.array_split(
+        np.arange(NUM_TRIALS), int(NUM_TRIALS / trials_per_exp)
+    )
     return [(min(y), max(y) + 1) for y in trial_nums]
 
 
+# Expensive validators get fewer trials per command,
+# so that every command takes roughly cost_budget seconds.
+def get_trials_per_exp(seconds_per_trial, trials_per_exp, cost_budget):
+    if cost_budget is None or seconds_per_trial is None:
+        return trials_per_exp
+    x = int(cost_budget // max(seconds_per_trial, 1e-6))
+    return min(max(x, 1), NUM_TRIALS)
+
+
+def flag_args_str(flag):
+    return dict_to_str({k: v for k, v in flag.items() if k != "validator"})
+
+
+# Validators without timings use the median of all timings,
+# or 1 second per trial if there are no timings at all.
+def get_command_cost(seconds_per_trial, trial_range, default_seconds_per_trial):
+    if seconds_per_trial is None:
+        seconds_per_trial = default_seconds_per_trial
+    if seconds_per_trial is None:
+        seconds_per_trial = 1
+    return seconds_per_trial * (trial_range[1] - trial_range[0])
+
+
+# Longest processing time first: the most expensive remaining command
+# goes to the job with the lowest total predicted cost that isn't full,
+# so the jobs' predicted costs end up about equal.
+def split_into_batches_by_cost(to_run, costs, exp_per_slurm_job):
+    num_batches = math.ceil(len(to_run) / exp_per_slurm_job)
+    batches = [[] for _ in range(num_batches)]
+    batch_costs = [0] * num_batches
+    for i in np.argsort(-np.array(costs), kind="stable"):
+        j = min(
+            (j for j in range(num_batches) if len(batches[j]) < exp_per_slurm_job),
+            key=lambda j: batch_costs[j],
+        )
+        batches[j].append(to_run[i])
+        batch_costs[j] += costs[i]
+    for c in batch_costs:
+        print(f"predicted job cost = {c / 60:.1f} minutes")
+    return batches
+
+
 def exp_launcher(args, commands):
     num_gpus = torch.cuda.device_count()
     print("num gpus available in exp_launcher =", num_gpus)
-    job_env = submitit.JobEnvironment()
-    local_rank = job_env.local_rank
+    local_rank = get_local_rank()
     gpu_list = list(range(num_gpus))
     use_devices = ",".join(str(x) for x in rotate(gpu_list, local_rank))
     command = commands[local_rank]
@@ -55,8 +107,8 @@ def get_exp_info_from_commands(commands, flag):
 
 def run_slurm_job(args, slurm_args, commands):
     exp_groups = get_exp_info_from_commands(commands, "exp_group")
-    executor = submitit.AutoExecutor(
-        folder=os.path.join(args.exp_folder, exp_groups[0], args.slurm_folder)
+    executor = get_executor(
+        args, os.path.join(args.exp_folder, exp_groups[0], args.slurm_folder)
     )
     exp_names = get_exp_info_from_commands(commands, "exp_name")
     exp_names = "_".join(exp_names)
@@ -127,10 +179,13 @@ def no_duplicates(x):
 
 
 def launcher(args, slurm_args, exp_groups):
-    to_run = []
+    to_run, costs = [], []
     assert no_duplicates(exp_groups)
     assert no_duplicates(args.exp_names)
+    seconds_per_trial_fn = get_seconds_per_trial_fn(args.exp_folder)
+    default_seconds_per_trial = get_default_seconds_per_trial(args.exp_folder)
     for exp_group in exp_groups:
+        dataset = exp_group.split("_")[0]
         for exp_name in args.exp_names:
             print(f"creating flags for {exp_group}/{exp_name}/{args.flags}")
             base_command = f"python validator_tests/main.py --exp_folder {args.exp_folder} --exp_group {exp_group} --exp_name {exp_name}"
@@ -138,25 +193,39 @@ def launcher(args, slurm_args, exp_groups):
                 base_command += " --skip_validator_errors"
             if args.use_glob:
                 base_command += " --use_glob"
-            flags = getattr(flags_module, args.flags)()
-            trial_ranges = get_trial_ranges(args.trials_per_exp)
-            flags = remove_completed_flags(
-                flags,
-                trial_ranges,
-                args.exp_folder,
-                exp_group,
-                exp_name,
-                args.use_glob,
-            )
-            flags = flags_to_strs(flags)
-            commands = [f"{base_command} {x}" for x in flags]
-            to_run.extend(commands)
+            for flag in getattr(flags_module, args.flags)():
+                seconds_per_trial = seconds_per_trial_fn(
+                    flag["validator"], flag_args_str(flag), dataset
+                )
+                trials_per_exp = get_trials_per_exp(
+                    seconds_per_trial, args.trials_per_exp, args.cost_budget
+                )
+                flags = remove_completed_flags(
+                    [flag],
+                    get_trial_ranges(trials_per_exp),
+                    args.exp_folder,
+                    exp_group,
+                    exp_name,
+                    args.use_glob,
+                )
+                costs.extend(
+                    get_command_cost(
+                        seconds_per_trial, f["trial_range"], default_seconds_per_trial
+                    )
+                    for f in flags
+                )
+                flags = flags_to_strs(flags)
+                commands = [f"{base_command} {x}" for x in flags]
+                to_run.extend(commands)
 
     if len(to_run) == 0:
         print("Jobs are already done. Exiting.")
         return
 
-    to_run = split_into_batches(to_run, args.exp_per_slurm_job)
+    if args.cost_budget is None:
+        to_run = split_into_batches(to_run, args.exp_per_slurm_job)
+    else:
+        to_run = split_into_batches_by_cost(to_run, costs, args.exp_per_slurm_job)
     print(f"{len(to_run)} slurm jobs")
     for commands in to_run:
         print(f"{len(commands)} exps in this job")
@@ -182,6 +251,8 @@ if __name__ == "__main__":
     parser.add_argument("--skip_validator_errors", action="store_true")
     parser.add_argument("--use_glob", action="store_true")
     parser.add_argument("--run", action="store_true")
+    parser.add_argument("--cost_budget", type=float, default=None)
+    add_executor_args(parser)
     args, unknown_args = parser.parse_known_args()
     slurm_args = create_slurm_args(args, unknown_args, "validator_tests")
     main(args, slurm_args)
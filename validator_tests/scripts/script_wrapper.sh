@@ -10,6 +10,9 @@ export CUDA_VISIBLE_DEVICES=${devices}
 
 echo "CUDA_VISIBLE_DEVICES=$CUDA_VISIBLE_DEVICES"
 
-conda deactivate && conda activate ${conda_env}
+# conda_env is "None" when it isn't set in constants.yaml (e.g. for local runs)
+if [ "${conda_env}" != "None" ]; then
+	conda deactivate && conda activate ${conda_env}
+fi
 
 ${command}
\ No newline at end of file
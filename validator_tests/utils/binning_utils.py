@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+# np.histogram_bin_edges and np.histogram2d fail on inf, and nan isn't in any bin
+def drop_non_finite(df, columns):
+    columns = [k for k in columns if pd.api.types.is_numeric_dtype(df[k])]
+    return df[np.isfinite(df[columns].to_numpy(dtype=float)).all(axis=1)]
+
+
+def get_bins(df, x, y, c=None, num_bins=200):
+    df = drop_non_finite(df, [x, y, *to_list(c)])
+    xs, ys = df[x].values, df[y].values
+    counts, x_edges, y_edges = np.histogram2d(xs, ys, bins=num_bins)
+    bins = {"x_edges": x_edges, "y_edges": y_edges, "counts": counts}
+    if c is not None:
+        sums, _, _ = np.histogram2d(
+            xs, ys, bins=[x_edges, y_edges], weights=df[c].values
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bins["c_mean"] = sums / counts
+    return bins
+
+
+def bin_centers(edges):
+    return (edges[:-1] + edges[1:]) / 2
+
+
+# one row per non-empty bin
+def bins_to_df(bins, x, y, c=None):
+    x_idx, y_idx = np.nonzero(bins["counts"])
+    df = {
+        x: bin_centers(bins["x_edges"])[x_idx],
+        y: bin_centers(bins["y_edges"])[y_idx],
+        "count": bins["counts"][x_idx, y_idx].astype(int),
+    }
+    if c is not None:
+        df[c] = bins["c_mean"][x_idx, y_idx]
+    return pd.DataFrame(df)
+
+
+# values must be finite
+def snap_to_bins(values, num_bins):
+    edges = np.histogram_bin_edges(values, bins=num_bins)
+    idx = np.clip(np.digitize(values, edges) - 1, 0, num_bins - 1)
+    return bin_centers(edges)[idx]
+
+
+# Collapses points into bins, keeping one row per (bin, group).
+# Non-numeric columns (e.g. "adapter") are left as-is.
+def bin_df(df, x, y, num_bins=200, groupby=None, c=None):
+    df = drop_non_finite(df, [x, y]).copy()
+    for k in [x, y]:
+        if pd.api.types.is_numeric_dtype(df[k]):
+            df[k] = snap_to_bins(df[k].values, num_bins)
+    keys = list(dict.fromkeys([x, y, *to_list(groupby)]))
+    grouped = df.groupby(keys, sort=False)
+    output = grouped.size().rename("count")
+    if c is not None:
+        output = pd.concat([output, grouped[c].mean()], axis=1)
+    return output.reset_index()
+
+
+def to_list(x):
+    if x is None:
+        return []
+    return [x] if isinstance(x, str) else list(x)
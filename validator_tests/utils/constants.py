@@ -2,6 +2,7 @@ JOBIDS_FILENAME = "all_validator_jobids.json"
 VALIDATOR_TESTS_FOLDER = "validator_tests"
 ALL_DFS_FILENAME = "all_dfs.pkl"
 PROCESSED_DF_FILENAME = "all_dfs_processed.pkl"
+TIMINGS_FILENAME = "validator_timings.jsonl"
 TARGET_ACCURACY = "target_train_micro"
 TARGET_VAL_ACCURACY = "target_val_micro"
 NUM_ADAPTERS = 10
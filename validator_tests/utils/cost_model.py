@@ -0,0 +1,63 @@
+import fcntl
+import json
+import os
+
+import pandas as pd
+
+from .constants import TIMINGS_FILENAME
+
+# from most to least specific
+COST_KEYS = [
+    ("validator", "flag_args", "dataset"),
+    ("validator", "dataset"),
+    ("validator",),
+]
+
+
+# Many validator_tests processes append to the same file,
+# so writes are locked, and reads never see a partially written line.
+def append_timing(exp_folder, record):
+    with open(os.path.join(exp_folder, TIMINGS_FILENAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(f"{json.dumps(record)}\n")
+        f.flush()
+
+
+def read_timings(exp_folder):
+    filepath = os.path.join(exp_folder, TIMINGS_FILENAME)
+    if not os.path.isfile(filepath):
+        return None
+    with open(filepath, "r") as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        return pd.read_json(f, lines=True, dtype=False)
+
+
+# Each timing record is the time it took to score one trial folder.
+# Returns a function that predicts the seconds per trial,
+# or None if there are no timings for that validator.
+def get_seconds_per_trial_fn(exp_folder):
+    df = read_timings(exp_folder)
+    medians = []
+    if df is not None and len(df) > 0:
+        for keys in COST_KEYS:
+            medians.append(df.groupby(list(keys))["seconds"].median().to_dict())
+
+    def fn(validator, flag_args, dataset):
+        query = {"validator": validator, "flag_args": flag_args, "dataset": dataset}
+        for keys, m in zip(COST_KEYS, medians):
+            k = tuple(query[x] for x in keys)
+            k = k[0] if len(k) == 1 else k
+            if k in m:
+                return m[k]
+        return None
+
+    return fn
+
+
+# The median over all timings, for validators without any timings.
+# None if there are no timings at all.
+def get_default_seconds_per_trial(exp_folder):
+    df = read_timings(exp_folder)
+    if df is None or len(df) == 0:
+        return None
+    return df["seconds"].median()
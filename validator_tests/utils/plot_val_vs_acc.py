@@ -1,13 +1,58 @@
 import os
 
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import seaborn as sns
+from matplotlib.colors import LogNorm
 from pytorch_adapt.utils import common_functions as c_f
 
+from .binning_utils import bins_to_df, drop_non_finite, get_bins
 from .constants import TARGET_ACCURACY
 from .plot_utils import filter_and_plot
 
 
+# Returns the plotted artist, and the bins that were drawn, as a dataframe
+# with one row per non-empty bin (see binning_utils.bins_to_df).
+def _binned_plot(df, x, y, c, bin_type, num_bins, cmap):
+    df = drop_non_finite(df, [x, y] if c is None else [x, y, c])
+    if bin_type == "hist2d":
+        bins = get_bins(df, x, y, c, num_bins)
+        if c is not None:
+            values, norm = bins["c_mean"], None
+        else:
+            values, norm = bins["counts"], LogNorm()
+        values = np.ma.masked_where(bins["counts"] == 0, values)
+        points = plt.pcolormesh(
+            bins["x_edges"], bins["y_edges"], values.T, cmap=cmap, norm=norm
+        )
+        return points, bins_to_df(bins, x, y, c)
+    elif bin_type == "hexbin":
+        hexbin_kwargs = {"gridsize": num_bins, "mincnt": 1}
+        points = plt.hexbin(
+            df[x],
+            df[y],
+            C=df[c] if c is not None else None,
+            reduce_C_function=np.mean,
+            bins="log" if c is None else None,
+            cmap=cmap,
+            **hexbin_kwargs,
+        )
+        # with the same gridsize and mincnt, the hexagons are in the same order
+        counts = plt.hexbin(df[x], df[y], **hexbin_kwargs)
+        counts.remove()
+        offsets = points.get_offsets()
+        bins_df = {
+            x: offsets[:, 0],
+            y: offsets[:, 1],
+            "count": np.asarray(counts.get_array()).astype(int),
+        }
+        if c is not None:
+            bins_df[c] = np.asarray(points.get_array())
+        return points, pd.DataFrame(bins_df)
+    raise ValueError(f"bin_type {bin_type} not supported")
+
+
 def _scatter_plot(
     df,
     x,
@@ -26,23 +71,29 @@ def _scatter_plot(
     alpha=None,
     cmap="rainbow",
     invert_cmap_axis=False,
+    bin_type=None,
+    num_bins=200,
 ):
     sns.set(font_scale=font_scale, style="whitegrid", rc={"figure.figsize": figsize})
-    if colorbar:
-        points = plt.scatter(
-            df[x],
-            df[y],
-            c=df[c] if c is not None else None,
-            s=s,
-            cmap=cmap,
-            alpha=alpha,
-        )
-        if c:
+    bins_df = None
+    if bin_type is not None or colorbar:
+        if bin_type is not None:
+            points, bins_df = _binned_plot(df, x, y, c, bin_type, num_bins, cmap)
+        else:
+            points = plt.scatter(
+                df[x],
+                df[y],
+                c=df[c] if c is not None else None,
+                s=s,
+                cmap=cmap,
+                alpha=alpha,
+            )
+        if c and colorbar:
             cbar = plt.colorbar(points)
             if invert_cmap_axis:
                 cbar.ax.invert_yaxis()
-        if colobar_label:
-            cbar.set_label(colobar_label)
+            if colobar_label:
+                cbar.set_label(colobar_label)
         if show_x_label:
             plt.xlabel(x if x_label is None else x_label)
         if show_y_label:
@@ -53,12 +104,15 @@ def _scatter_plot(
     else:
         plot = sns.scatterplot(data=df, x=x, y=y, hue=c, s=s, alpha=alpha)
         fig = plot.get_figure()
-    return fig
+    return fig, bins_df
 
 
-def scatter_plot(plots_folder, df, x, y, filename, **kwargs):
-    fig = _scatter_plot(df, x, y, **kwargs)
+def scatter_plot(plots_folder, df, x, y, filename, save_bins=False, **kwargs):
+    fig, bins_df = _scatter_plot(df, x, y, **kwargs)
     c_f.makedir_if_not_there(plots_folder)
+    # only the bins that were drawn are saved
+    if save_bins and bins_df is not None:
+        bins_df.to_pickle(os.path.join(plots_folder, f"{filename}_bins.pkl"))
     fig.savefig(
         os.path.join(plots_folder, f"{filename}.png"),
         bbox_inches="tight",
@@ -0,0 +1,75 @@
+import copy
+import os
+import time
+
+import torch
+from pytorch_adapt.utils import common_functions as c_f
+
+from validator_tests import configs
+
+from . import utils
+from .constants import VALIDATOR_TESTS_FOLDER
+
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def assert_curr_dict(curr_dict):
+    x = set(curr_dict.keys()).intersection({"validator", "validator_args", "score"})
+    if len(x) > 0:
+        raise KeyError("curr_dict already has some validation related keys")
+
+
+def get_and_save_scores(
+    validator_name,
+    validator,
+    validator_args_str,
+    all_scores,
+    skip_validator_errors,
+    timings,
+):
+    def fn(epoch, x, exp_config, exp_folder):
+        if isinstance(validator, configs.DEV):
+            # temporarily appending epoch to folder name
+            # because of folder deletion problem
+            temp_folder = os.path.join(
+                exp_folder,
+                VALIDATOR_TESTS_FOLDER,
+                f"{utils.validator_str(validator_name, validator_args_str)}_{epoch}",
+            )
+            validator.validator.temp_folder = temp_folder
+            # temporarily disabling this
+            # if os.path.isdir(temp_folder):
+            # shutil.rmtree(temp_folder)  # delete any old copies
+        error_was_raised = False
+        start = time.time()
+        try:
+            score = validator.score(x, exp_config, DEVICE)
+        except Exception as e:
+            if skip_validator_errors:
+                error_was_raised = True
+                c_f.LOGGER.info(e)
+                c_f.LOGGER.info(
+                    "Ignoring validator exception because skip_validator_errors is True"
+                )
+            else:
+                raise
+        timings["dataset"] = exp_config["dataset"]
+        timings["seconds"].append(time.time() - start)
+
+        if skip_validator_errors and error_was_raised:
+            return
+
+        curr_dict = copy.deepcopy(exp_config)
+        assert_curr_dict(curr_dict)
+        curr_dict["trial_params"] = utils.dict_to_str(curr_dict["trial_params"])
+        curr_dict["epoch"] = epoch
+        curr_dict.update(
+            {
+                "validator": validator_name,
+                "validator_args": validator_args_str,
+                "score": score,
+            }
+        )
+        all_scores.append(curr_dict)
+
+    return fn